@@ -1,6 +1,14 @@
+from pathlib import Path
+
+STARTUP = Path.home() / 'bin' / 'pythonstartup.py'
+
+
 def configure(repl):
     repl.prompt_style = "classic"  # 'classic' or 'ipython'
     repl.confirm_exit = False
     repl.use_code_colorscheme("paraiso-dark")
     repl.enable_auto_suggest = True
     repl.insert_blank_line_after_output = False
+
+    # the same lazily imported names as plain python
+    exec(compile(STARTUP.read_text(), STARTUP, 'exec'), repl.get_globals())
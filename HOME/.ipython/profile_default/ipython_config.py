@@ -1,8 +1,12 @@
+import os
+
 c.TerminalIPythonApp.display_banner = False
 c.TerminalInteractiveShell.confirm_exit = False
 c.TerminalInteractiveShell.highlighting_style = "monokai"
 c.TerminalInteractiveShell.term_title = False
 c.TerminalInteractiveShell.autoformatter = None
+# the same lazily imported names as plain python
+c.InteractiveShellApp.exec_files = [os.path.expanduser('~/bin/pythonstartup.py')]
 
 import logging
 
@@ -0,0 +1,78 @@
+"""The current AWS profile, quick enough to look up from a shell prompt.
+
+Finding the profile means parsing ~/.aws/credentials, so the result is
+cached in a small file keyed on the credentials file's path, modification
+time and size. A lookup that hits the cache imports nothing but os.
+"""
+import os
+
+CREDENTIALS = '~/.aws/credentials'
+CACHE_VERSION = '1'  # bump when the result could change for the same file
+
+
+def cache_path():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache, 'setup', 'aws-profile')
+
+
+def parse_profile_name(path):
+    """Return the name of the profile with the same access key as 'default'.
+
+    Return 'default' if no other profile matches, and None if the file
+    can't be read or has no 'default' section.
+
+    https://docs.aws.amazon.com/cli/latest/userguide/cli-configure-profiles.html
+    """
+    import configparser
+
+    k = 'aws_access_key_id'
+    d = 'default'
+    c = configparser.ConfigParser()
+    try:
+        with open(path) as file:
+            c.read_file(file)
+        if d not in c:
+            return None
+    except Exception:
+        return None
+
+    # look for the the profile whose access key id matches default's
+    reverse_map = {c[s][k]: s for s in set(c.sections()) - {d} if k in c[s]}
+    return reverse_map.get(c[d].get(k), 'default')
+
+
+def profile_name(credentials=CREDENTIALS, cache=None):
+    """Return the current AWS profile name, or None if there isn't one.
+
+    $AWS_PROFILE wins if it's set. Otherwise it's found in the credentials
+    file, or in the cache if the file hasn't changed since.
+    """
+    if name := os.environ.get('AWS_PROFILE'):
+        return name
+
+    path = os.path.expanduser(credentials)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = f'{CACHE_VERSION}\0{path}\0{stat.st_mtime_ns}\0{stat.st_size}'
+
+    cache = cache or cache_path()
+    try:
+        with open(cache) as file:
+            cached_key, _, name = file.read().partition('\n')
+        if cached_key == key:
+            return name or None
+    except OSError:
+        pass
+
+    name = parse_profile_name(path)
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        temp = f'{cache}.{os.getpid()}.tmp'
+        with open(temp, 'w') as file:
+            file.write(f'{key}\n{name or ""}')
+        os.replace(temp, cache)
+    except OSError:
+        pass
+    return name
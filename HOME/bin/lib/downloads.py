@@ -0,0 +1,206 @@
+"""A shared, content-addressed cache of downloaded files.
+
+Files are stored once under their sha256 in ~/.cache/setup/downloads, with
+an index from each url to its file and the ETag/Last-Modified validators
+the server sent. A cached url is revalidated with a conditional request,
+and not requested at all if the caller knows the sha256 to expect.
+Least recently used files are evicted when the cache outgrows its size.
+The index is only changed while holding a lock on index.lock, so several
+processes can share the cache.
+
+Installing from the cache copies the file into place, as a clone sharing
+its blocks where the filesystem supports it (APFS, btrfs, XFS), so it's
+cheap but changing the installed file can't change the cached one.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+MAX_SIZE = 10 * 2**30
+CHUNK_SIZE = 2**20
+TIMEOUT = 60  # seconds to wait to connect, and for each read
+FICLONE = 0x40049409  # Linux ioctl to clone a file's blocks
+
+
+def cache_dir():
+    return Path(os.environ.get('XDG_CACHE_HOME') or '~/.cache').expanduser() / 'setup' / 'downloads'
+
+
+class DownloadCache:
+    def __init__(self, root=None, max_size=MAX_SIZE):
+        self.root = Path(root or cache_dir())
+        self.blobs = self.root / 'blobs'
+        self.index_path = self.root / 'index.json'
+        self.max_size = max_size
+
+    def _index(self):
+        try:
+            return json.loads(self.index_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive lock on the index, across threads and processes.
+
+        The lock is on a separate file, as the index itself is replaced
+        rather than written in place.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / 'index.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released when closed
+            yield
+
+    def _save_index(self, index):
+        temp = self.index_path.with_name(f'index.{os.getpid()}.tmp')
+        temp.write_text(json.dumps(index, indent=2, sort_keys=True))
+        temp.replace(self.index_path)
+
+    def _blob(self, digest):
+        path = self.blobs / digest
+        if not path.exists():
+            return None
+        path.touch()  # mark as recently used
+        return path
+
+    def fetch(self, url, sha256=None):
+        """Return the path of the cached file for url, downloading if needed.
+
+        If sha256 is given and already cached, don't touch the network, and
+        raise ValueError if a download doesn't match it.
+        """
+        if sha256 and (blob := self._blob(sha256)):
+            return blob
+
+        entry = self._index().get(url)
+        blob = entry and self._blob(entry['sha256'])
+        request = urllib.request.Request(url, headers={'User-Agent': 'setup'})
+        if blob:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+        try:
+            response = urllib.request.urlopen(request, timeout=TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if blob and e.code == 304:
+                log.info(f"Not modified: {url}")
+                return blob
+            raise
+        except (urllib.error.URLError, TimeoutError) as e:
+            if blob:
+                log.warning(f"Using cached {url}, couldn't revalidate: {getattr(e, 'reason', e)}")
+                return blob
+            raise
+
+        with response:
+            return self._store(url, response, sha256)
+
+    def _store(self, url, response, sha256):
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix='download.', delete=False) as temp:
+            try:
+                while chunk := response.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(temp.name)
+                raise
+
+        actual = digest.hexdigest()
+        if sha256 and actual != sha256:
+            os.unlink(temp.name)
+            raise ValueError(f"sha256 of {url} is {actual}, expected {sha256}")
+
+        blob = self.blobs / actual
+        os.chmod(temp.name, 0o444)
+        os.replace(temp.name, blob)
+
+        with self._locked():
+            index = self._index()
+            index[url] = dict(
+                sha256=actual,
+                size=size,
+                filename=_filename(url, response),
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
+            self._save_index(index)
+        self.evict(keep=blob)
+        return blob
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache fits max_size."""
+        with self._locked():
+            blobs = sorted(
+                (p.stat().st_mtime, p.stat().st_size, p) for p in self.blobs.iterdir()
+            ) if self.blobs.exists() else []
+            total = sum(size for _, size, _ in blobs)
+            removed = set()
+            for _, size, path in blobs:
+                if total <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                path.unlink()
+                removed.add(path.name)
+                total -= size
+
+            if removed:
+                index = self._index()
+                self._save_index({u: e for u, e in index.items() if e['sha256'] not in removed})
+
+    def digest(self, url):
+        """Return the sha256 of the file last downloaded from url, or None."""
+        entry = self._index().get(url)
+        return entry and entry['sha256']
+
+    def install(self, url, dest_dir, sha256=None):
+        """Place the file for url in dest_dir and return its path."""
+        blob = self.fetch(url, sha256)
+        entry = self._index().get(url) or {}
+        dest = Path(dest_dir, entry.get('filename') or _filename(url))
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.unlink(missing_ok=True)
+        _clone(blob, dest)
+        return dest
+
+
+def _clone(source, dest):
+    """Copy source to dest, sharing its blocks if the filesystem can."""
+    try:
+        if sys.platform == 'darwin':
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(os.fsencode(source), os.fsencode(dest), 0) != 0:
+                raise OSError(ctypes.get_errno(), "clonefile failed")
+        else:
+            with open(source, 'rb') as src, open(dest, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:  # eg. a different filesystem, or one that can't clone
+        dest.unlink(missing_ok=True)
+        shutil.copyfile(source, dest)
+    os.chmod(dest, 0o644)  # not read-only like the cached file
+
+
+def _filename(url, response=None):
+    """Return the name to save a download as, preferring Content-Disposition."""
+    if response is not None and (name := response.headers.get_filename()):
+        return os.path.basename(name)
+    return os.path.basename(urllib.parse.unquote(urllib.parse.urlparse(url).path)) or 'download'
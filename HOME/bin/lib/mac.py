@@ -1,8 +1,11 @@
-import ast
-import json
+import base64
+import copy
+import datetime
 import logging
-import re
+import plistlib
 import subprocess
+import tempfile
+from contextlib import contextmanager
 from itertools import chain
 
 from .utils import run
@@ -10,8 +13,30 @@ from .utils import run
 log = logging.getLogger(__name__)
 
 
-def restart_os_functions():
-    for item in ('Finder', 'Dock', 'SystemUIServer', 'cfprefsd'):
+# Processes to restart for settings to take effect, and the domains they own.
+# A domain also owns its subdomains (eg. com.apple.menuextra.clock).
+# cfprefsd caches every domain.
+OS_FUNCTIONS = {
+    'Finder': ('com.apple.finder',),
+    'Dock': ('com.apple.dock', 'com.apple.dashboard'),
+    'SystemUIServer': ('com.apple.systemuiserver', 'com.apple.menuextra'),
+    'cfprefsd': None,
+}
+
+
+def _owns(owned, domain):
+    return owned is None or any(domain == d or domain.startswith(f'{d}.') for d in owned)
+
+
+def restart_os_functions(domains=None):
+    """Restart Finder, Dock etc. so changed settings take effect.
+
+    If 'domains' is given, only restart what owns one of those domains.
+    """
+    for item, owned in OS_FUNCTIONS.items():
+        if domains is not None and not any(_owns(owned, d) for d in domains):
+            continue
+
         cmd = ['killall', item]
         log.info(f"Executing command: {cmd!r}")
         subprocess.check_call(cmd)
@@ -24,8 +49,6 @@ DEFAULTS_TYPE_MAP = {
     str: 'string',
     dict: 'dict',
     list: 'array',
-    # todo: conversion procsess between bytes and <62706c69 73743030 d4010203...>
-    # format that 'defaults' uses
     bytes: 'data',
 }
 REVERSE_TYPE_MAP = {v: k for k, v in DEFAULTS_TYPE_MAP.items()}
@@ -41,12 +64,102 @@ def flatten(value):
         result.extend(chain.from_iterable((k, *flatten(v)) for k, v in value.items()))
     elif isinstance(value, list):
         result.extend(map(str, value))
+    elif isinstance(value, bytes):
+        result.append(value.hex())
     else:
         result.append(str(value))
 
     return result
 
+
+def as_written(value):
+    """Return value as 'defaults write' with flatten(value) stores it: array items are strings."""
+    if isinstance(value, dict):
+        return {k: as_written(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return value
+
+
+def same_value(a, b):
+    """Compare two values as 'defaults' stores them, so eg. True != 1."""
+    if DEFAULTS_TYPE_MAP.get(type(a)) != DEFAULTS_TYPE_MAP.get(type(b)):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_value(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(same_value, a, b))
+    return a == b
+
+
+def _json_value(value):
+    """Return a value read from 'defaults' as JSON types: data as base64, dates in ISO 8601."""
+    if isinstance(value, dict):
+        return {k: _json_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_value(v) for v in value]
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+MISSING = object()
+
+
+class DefaultsBatch:
+    """Writes collected by `_DefaultsDomain.batch`, compared once per domain.
+
+    Each domain is exported once, and only keys whose current value differs
+    are written, one 'defaults write' each, as they would have been outside
+    the batch. After applying, 'plan' lists each change as (host, domain,
+    key, old, new) and 'changed' is the set of domains that were (or, for a
+    dry run, would be) written.
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.writes = {}  # (host, domain) -> {key: (value, whether to write it as a plist)}
+        self.plan = []
+        self.changed = set()
+
+    def add(self, parent, key, value, as_plist=False):
+        self.writes.setdefault((parent.host, parent.domain), {})[key] = (value, as_plist)
+
+    def apply(self):
+        for (host, domain), values in self.writes.items():
+            target = _DefaultsDomain(domain, host)
+            current = target.snapshot()
+            changes = {
+                k: (v, as_plist) for k, (v, as_plist) in values.items()
+                if not same_value(current.get(k, MISSING), v if as_plist else as_written(v))
+            }
+            if not changes:
+                continue
+
+            self.changed.add(domain)
+            for key, (value, _) in changes.items():
+                old = current.get(key, MISSING)
+                self.plan.append((host, domain, key, None if old is MISSING else old, value))
+                if self.dry_run:
+                    print(f"Would set {domain} {key!r}: {'(unset)' if old is MISSING else repr(old)} -> {value!r}")
+
+            if not self.dry_run:
+                # key by key, since other processes write to domains like -g all the
+                # time, and importing the whole domain would undo what they wrote
+                log.info(f"Writing {len(changes)} key(s) to {domain}")
+                for key, (value, as_plist) in changes.items():
+                    if as_plist:
+                        DefaultsValue(target, key)._write_plist(value)
+                    else:
+                        DefaultsValue(target, key)._write(value)
+
+
 class _DefaultsDomain:
+    _batch = None  # the open DefaultsBatch, shared by all domains
+    _snapshots = None  # (host, domain) -> exported values, while caching
+
     def __init__(self, domain=None, host=None):
         self.domain = domain
         self.host = host
@@ -68,13 +181,81 @@ class _DefaultsDomain:
     def __setitem__(self, key, value):
         return DefaultsValue(self, key).write(value)
 
+    @contextmanager
+    def batch(self, dry_run=False):
+        """Collect writes made inside the block and apply them per domain.
+
+        Each domain written to is exported once and compared with the new
+        values, and only the keys that differ are written. With 'dry_run',
+        print the changes instead of
+        making them. Nothing is written if the block raises. Nested batches
+        join the outer one.
+        """
+        if _DefaultsDomain._batch is not None:
+            yield _DefaultsDomain._batch
+            return
+
+        batch = _DefaultsDomain._batch = DefaultsBatch(dry_run)
+        try:
+            yield batch
+        finally:
+            _DefaultsDomain._batch = None
+        batch.apply()
+
+    @contextmanager
+    def cache(self):
+        """Serve reads inside the block from one export per domain.
+
+        Values are read from memory after the first read of their domain.
+        Writes through this module update or drop the cached domain, but
+        changes made elsewhere aren't seen until the block exits.
+        """
+        if _DefaultsDomain._snapshots is not None:
+            yield
+            return
+
+        _DefaultsDomain._snapshots = {}
+        try:
+            yield
+        finally:
+            _DefaultsDomain._snapshots = None
+
+    def export(self):
+        xml = run(self.command("export") + [self.domain, '-'], cap='stdout')
+        return plistlib.loads(xml.encode())
+
+    def _key(self):
+        return (self.host, self.domain)
+
+    def snapshot(self):
+        """Return all values in the domain, exported once if caching."""
+        if self._snapshots is None:
+            return self.export()
+
+        key = self._key()
+        if key not in self._snapshots:
+            self._snapshots[key] = self.export()
+        return self._snapshots[key]
+
+    def _update_snapshot(self, values=None):
+        """Replace the cached domain with 'values', or drop it if None."""
+        if self._snapshots is None:
+            return
+
+        if values is None:
+            self._snapshots.pop(self._key(), None)
+        else:
+            self._snapshots[self._key()] = values
+
     def read_str(self):
         return run(self.command("read") + [self.domain], cap=True).rstrip('\n')
 
-    def read_json(self):
-        return json.loads(run(["plist-to-json"], cap=True, input=self.read_str()))
+    def read(self):
+        """Read the whole domain, typed as it's stored, from 'defaults export'."""
+        return copy.deepcopy(self.snapshot())
 
-    read = read_str  # todo: read should really return a Python data structure
+    def read_json(self):
+        return _json_value(self.snapshot())
 
 
 class DefaultsValue:
@@ -82,7 +263,17 @@ class DefaultsValue:
         self.parent = parent
         self.key = key
 
+    def _cached(self):
+        """Return the cached domain, or None if reads aren't being cached."""
+        if self.parent._snapshots is None:
+            return None
+
+        return self.parent.snapshot()
+
     def type(self):
+        if (values := self._cached()) is not None:
+            return type(values[self.key])
+
         typestr = run(
             self.parent.command("read-type") + [self.parent.domain, self.key],
             cap=True
@@ -97,40 +288,53 @@ class DefaultsValue:
             cap=True
         ).rstrip('\n')
 
-    def read_json(self):
-        return json.loads(run(["plist-to-json"], cap=True, input=self.read_str()))
-
     def read(self):
-        t = self.type()
-        s = self.read_str()
-        if t == str:
-            return s
-        elif t != dict:
-            return t(ast.literal_eval(s))
-
-        # parse dict. Looks like: '{\n    keyCode = 47;\n    modifierFlags = 1310720;\n}\n'
-        stripped_lines = (l.strip() for l in s.strip().strip('{}').splitlines())
-        lines = [line for line in stripped_lines if line]
-        return {
-            m[1]: ast.literal_eval(m[2])
-            for m in (re.search(r'(\w+)\s+=\s+(.*);', line) for line in lines)
-        }
+        """Read the value, typed as it's stored, from 'defaults export'.
+
+        The text 'defaults read' prints loses types (booleans print as 1,
+        floats in dicts as strings, long data is elided), so reads go
+        through the exported plist whether or not they're cached, and
+        return the same either way. A key that isn't set raises KeyError.
+        """
+        return copy.deepcopy(self.parent.snapshot()[self.key])
+
+    def read_json(self):
+        return _json_value(self.parent.snapshot()[self.key])
 
     def write(self, value):
-        return run(
+        if self.parent._batch is not None:
+            return self.parent._batch.add(self.parent, self.key, value)
+        return self._write(value)
+
+    def _write(self, value):
+        result = run(
             self.parent.command("write") +
             [self.parent.domain, self.key, *flatten(value)]
         )
+        # 'defaults write' may store a different type (eg. array items are
+        # always strings), so have the next read export the domain again
+        self.parent._update_snapshot(None)
+        return result
 
     @staticmethod
     def _get_plist(value):
-        return run(["json-to-plist"], cap=True, input=json.dumps(value))
+        return plistlib.dumps(value).decode()
 
     def write_plist(self, value):
-        return run(
+        if self.parent._batch is not None:
+            return self.parent._batch.add(self.parent, self.key, value, as_plist=True)
+        return self._write_plist(value)
+
+    def _write_plist(self, value):
+        result = run(
             self.parent.command("write") +
             [self.parent.domain, self.key, self._get_plist(value)]
         )
+        # plists keep their types, so a cached domain can be updated in place
+        snapshots = self.parent._snapshots
+        if snapshots is not None and self.parent._key() in snapshots:
+            snapshots[self.parent._key()][self.key] = copy.deepcopy(value)
+        return result
 
     __str__ = read_str
 
@@ -138,3 +342,53 @@ class DefaultsValue:
 defaults = _DefaultsDomain()
 defaults.g = defaults['-g']  # type: ignore
 defaults.currentHost = _DefaultsDomain(host=True)  # type: ignore
+
+
+# Where LaunchServices keeps the default handler of each content type (UTI),
+# as a list of dicts under 'LSHandlers'.
+LAUNCH_SERVICES = 'com.apple.LaunchServices/com.apple.launchservices.secure'
+
+
+def current_handlers():
+    """Return {uti: bundle id} of the handlers set for all roles, in one export."""
+    handlers = defaults[LAUNCH_SERVICES].snapshot().get('LSHandlers', [])
+    return {
+        h['LSHandlerContentType'].lower(): h['LSHandlerRoleAll']
+        for h in handlers
+        if 'LSHandlerContentType' in h and 'LSHandlerRoleAll' in h
+    }
+
+
+def sync_associations(associations, dry_run=False):
+    """Make each bundle id the default app for its UTI, in one 'duti' call.
+
+    'associations' is an iterable of (uti, bundle id). The current handlers
+    are read once, and only those that differ are passed to duti in a
+    settings file, so running it again changes nothing. Bundle ids are
+    compared ignoring case, as LaunchServices stores them lowercased. With
+    'dry_run', print the changes instead of making them.
+
+    Return the changes as (uti, old bundle id or None, new bundle id).
+    """
+    current = current_handlers()
+    changes = [
+        (uti, current.get(uti.lower()), bundleid)
+        for uti, bundleid in associations
+        if current.get(uti.lower(), '').lower() != bundleid.lower()
+    ]
+    if not changes:
+        return changes
+
+    if dry_run:
+        for uti, old, new in changes:
+            print(f"Would open {uti} with {new} (was {old or '(unset)'})")
+        return changes
+
+    log.info(f"Setting the default app for {len(changes)} type(s)")
+    with tempfile.NamedTemporaryFile('w', prefix='duti.', suffix='.txt') as settings:
+        settings.writelines(f'{new}\t{uti}\tall\n' for uti, _old, new in changes)
+        settings.flush()
+        run(['duti', settings.name])
+    # have the next read see what duti wrote
+    defaults[LAUNCH_SERVICES]._update_snapshot(None)
+    return changes
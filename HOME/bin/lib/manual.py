@@ -0,0 +1,327 @@
+"""Install software that is more manual, as configured in conf/manual.toml.
+
+For example, software that isn't configured with a package manager like
+Homebrew, where an archive needs to be downloaded and unpacked, or a repo
+needs to be checked out from git and a program manually built.
+
+Packages are installed concurrently. A package waits for the packages
+listed in its 'depends' field, clones and downloads share a network
+concurrency limit, and builds share a CPU one.
+
+What was installed is recorded in packages_dir/.install-state.json. In
+incremental mode, git packages whose upstream commit hasn't changed are
+skipped, and ones that have are fetched and rebuilt in place. Packages
+are only cloned from scratch if their checkout doesn't match the state.
+Likewise, url packages whose download is the one last installed are
+skipped.
+
+Downloads go through the shared cache in lib.downloads, so reinstalling a
+url package doesn't download it again.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .downloads import DownloadCache
+from .utils import run, run_iter
+
+NETWORK_JOBS = 4
+STATE_FILE = '.install-state.json'
+
+_print_lock = threading.Lock()
+
+
+def report(key, message):
+    with _print_lock:
+        print(f"[{key}] {message}", flush=True)
+
+
+def dependency_order(packages, keys):
+    """Return 'keys' ordered so each package comes after its dependencies.
+
+    Dependencies that aren't in 'keys' are assumed to be installed already.
+    Raise ValueError for unknown dependencies or a dependency cycle.
+    """
+    keys = list(keys)
+    selected = set(keys)
+    order, state = [], {}  # state: key -> 'visiting' | 'done'
+
+    def visit(key, path):
+        if state.get(key) == 'done':
+            return
+        if state.get(key) == 'visiting':
+            raise ValueError(f"Dependency cycle: {' -> '.join([*path, key])}")
+
+        state[key] = 'visiting'
+        for dep in packages[key].get('depends', []):
+            if dep not in packages:
+                raise ValueError(f"{key} depends on unknown package {dep!r}")
+            if dep in selected:
+                visit(dep, [*path, key])
+        state[key] = 'done'
+        order.append(key)
+
+    for key in keys:
+        visit(key, [])
+    return order
+
+
+def installed(packages, packages_dir):
+    """Return the keys of the packages that have been installed to packages_dir."""
+    state = InstallState(packages_dir)
+    return [key for key in packages if state.get(key) or Path(packages_dir, key).exists()]
+
+
+class InstallState:
+    """The params and commit last installed for each package."""
+
+    def __init__(self, packages_dir):
+        self.path = Path(packages_dir, STATE_FILE)
+        self.lock = threading.Lock()
+        try:
+            self.packages = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.packages = {}
+
+    def get(self, key):
+        return self.packages.get(key)
+
+    def set(self, key, record):
+        """Record what's installed for key, or that it's unknown if None."""
+        with self.lock:
+            if record is None:
+                self.packages.pop(key, None)
+            else:
+                self.packages[key] = record
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.path.with_name(f'{STATE_FILE}.tmp')
+            temp.write_text(json.dumps(self.packages, indent=2, sort_keys=True, default=str))
+            temp.replace(self.path)
+
+
+def _run(key, cmd, **kwargs):
+    """Run cmd for a package, printing its output as it comes, prefixed with the key.
+
+    'cmd' is one command or a tuple of them, as for run_commands.
+    """
+    for c in cmd if isinstance(cmd, tuple) else [cmd]:
+        for line in run_iter(c, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT, errors='replace', **kwargs):
+            report(key, line.rstrip('\n'))
+
+
+def fetch(key, params, packages_dir):
+    """Clone or download a package to a fresh directory.
+
+    Return the directory and the downloaded file, if there was one.
+    """
+    git = params.get('git')  # url of git repository to clone
+    tag = params.get('tag')  # tag of git repo to get
+    url = params.get('url')  # url of file to download
+    sha256 = params.get('sha256')  # expected hash of url, to skip revalidating it
+
+    # remove destination if exists
+    package_dir = Path(packages_dir, key)
+    assert Path.home() in package_dir.parents, f"path ({package_dir}) must be under $HOME"
+    if package_dir.exists():
+        report(key, f"Deleting existing directory: {package_dir}")
+        shutil.rmtree(package_dir)
+
+    if git:
+        report(key, f"Cloning {git} to {package_dir}")
+        c = ['git', 'clone', '--depth', '1', '--recurse-submodules']
+        if tag:
+            c += ['--branch', tag]
+        c += [git, package_dir]
+        _run(key, c)
+    download = None
+    if url:
+        report(key, f"Downloading {url} to {package_dir}")
+        download = DownloadCache().install(url, package_dir, sha256)
+
+    return package_dir, download
+
+
+def remote_commit(git, tag=None):
+    """Return the commit that 'tag' (or the default branch) is upstream."""
+    patterns = [tag, f'{tag}^{{}}'] if tag else ['HEAD']  # ^{} is an annotated tag's commit
+    output = run(['git', 'ls-remote', git, *patterns], cap='stdout')
+    refs = {ref: sha for sha, ref in (line.split('\t') for line in output.splitlines())}
+    names = [f'refs/tags/{tag}^{{}}', f'refs/tags/{tag}', f'refs/heads/{tag}'] if tag else ['HEAD']
+    for name in names:
+        if name in refs:
+            return refs[name]
+
+    raise ValueError(f"{tag or 'HEAD'} not found in {git}")
+
+
+def checkout_commit(package_dir):
+    """Return the commit checked out in package_dir, or None if it isn't a repo."""
+    if not Path(package_dir, '.git').exists():
+        return None
+    try:
+        return run(['git', 'rev-parse', 'HEAD'], cap=True, cwd=package_dir).strip()
+    except subprocess.CalledProcessError:
+        return None
+
+
+def sync(key, params, packages_dir, state):
+    """Bring a git package up to date, in place where possible.
+
+    Return the package directory and whether anything changed.
+    """
+    package_dir = Path(packages_dir, key)
+    recorded = state.get(key)
+    upstream = remote_commit(params['git'], params.get('tag'))
+    consistent = (
+        recorded is not None
+        and recorded['params'] == params
+        and checkout_commit(package_dir) == recorded['commit']
+    )
+    if not consistent:
+        report(key, "Checkout doesn't match install state, reinstalling")
+        state.set(key, None)
+        return fetch(key, params, packages_dir)[0], True
+
+    if recorded['commit'] == upstream:
+        return package_dir, False
+
+    report(key, f"Updating {recorded['commit'][:10]} to {upstream[:10]}")
+    state.set(key, None)  # until it's rebuilt, the checkout doesn't match anything
+    _run(key, ['git', 'fetch', '--depth', '1', 'origin', params.get('tag') or 'HEAD'], cwd=package_dir)
+    _run(key, ['git', 'checkout', '--force', '--detach', 'FETCH_HEAD'], cwd=package_dir)
+    _run(key, ['git', 'submodule', 'update', '--init', '--recursive', '--depth', '1'], cwd=package_dir)
+    return package_dir, True
+
+
+def download_unchanged(params, packages_dir, key, state):
+    """Return whether a url package's download is still the one last installed.
+
+    The download is revalidated through the cache, so this is a conditional
+    request at most.
+    """
+    recorded = state.get(key)
+    if not (recorded and recorded['params'] == params and recorded.get('sha256')):
+        return False
+    if not Path(packages_dir, key).exists():
+        return False
+    return DownloadCache().fetch(params['url'], params.get('sha256')).name == recorded['sha256']
+
+
+def build(key, params, cwd):
+    """Run any build/extract commands."""
+    cmd = params.get('cmd')  # commands to run after cloning
+    exe = params.get('exe')  # shell executable argument to run(exe=...)
+    report(key, f"Running {cmd}" + (f" ({exe})" if exe else ''))
+    _run(key, cmd, cwd=cwd, exe=exe)
+
+
+def link(key, params, packages_dir, bin_dir, cwd, download=None):
+    """Install any binaries or apps from a package into bin_dir.
+
+    'download' is the file downloaded from the package's url, if any.
+    """
+    bin = params.get('bin')  # path to the executable to install in ~/bin
+    dmg = params.get('dmg')  # if url is dmg, path of app inside dmg
+
+    # symlink any binaries specified to bin_dir
+    if bin:
+        # accept either a string or a sequence of strings
+        binaries = [bin] if isinstance(bin, str) else bin
+        report(key, f"Linking binaries: {', '.join(binaries)}")
+        for b in binaries:
+            _run(key, ['symgr', '-I', Path(packages_dir, key, b), bin_dir])
+
+    # mount the dmg specified in 'url' and copy the app out of it
+    if dmg:
+        _run(key, (
+            ['hdiutil', 'attach', '-nobrowse', download],
+            ['cp', '-r', dmg, bin_dir],
+            ['hdiutil', 'detach', os.path.dirname(dmg)],
+        ), cwd=cwd)
+
+
+def install(key, params, packages_dir, bin_dir, network, cpu, state, incremental=False):
+    """Install a package. Return False if it was already up to date."""
+    cwd = bin_dir  # execute in bin_dir by default
+    download = None
+
+    # get something and create the destination directory
+    if params.get('git') or params.get('url'):
+        with network:
+            if incremental and params.get('git'):
+                cwd, changed = sync(key, params, packages_dir, state)
+                if not changed:
+                    return False
+            elif incremental and download_unchanged(params, packages_dir, key, state):
+                return False
+            else:
+                state.set(key, None)
+                cwd, download = fetch(key, params, packages_dir)
+        # run in context of package_dir from here
+
+    if params.get('cmd'):
+        with cpu:
+            build(key, params, cwd)
+
+    link(key, params, packages_dir, bin_dir, cwd, download)
+    record = {'params': params, 'commit': checkout_commit(cwd) if params.get('git') else None}
+    if params.get('url'):
+        record['sha256'] = DownloadCache().digest(params['url'])
+    state.set(key, record)
+    return True
+
+
+def install_packages(
+    packages, keys, packages_dir, bin_dir, jobs=None, network_jobs=NETWORK_JOBS, incremental=False
+):
+    """Install the packages named in 'keys' concurrently.
+
+    packages_dir is where to install packages (eg. ~/3rdparty)
+    bin_dir is your $HOME/bin dir, or wherever to install any binaries to
+    jobs limits concurrent builds, network_jobs concurrent clones/downloads
+    incremental skips or updates git packages in place instead of recloning
+
+    A package that fails doesn't stop the others, but packages that depend
+    on it are skipped. Return a dict of key -> (status, seconds), where
+    status is 'installed', 'up to date', 'failed' or 'skipped'.
+    """
+    order = dependency_order(packages, keys)
+    state = InstallState(packages_dir)
+    network = threading.BoundedSemaphore(network_jobs)
+    cpu = threading.BoundedSemaphore(jobs or os.cpu_count())
+    results = {}
+    futures = {}
+
+    def work(key):
+        depends = [d for d in packages[key].get('depends', []) if d in futures]
+        if failed := [d for d in depends if futures[d].result() in ('failed', 'skipped')]:
+            report(key, f"Skipped: depends on {', '.join(failed)}")
+            results[key] = ('skipped', 0.0)
+            return 'skipped'
+
+        start = time.monotonic()
+        try:
+            changed = install(key, packages[key], packages_dir, bin_dir, network, cpu, state, incremental)
+        except Exception as e:
+            status = 'failed'
+            report(key, f"Failed: {e}")
+        else:
+            status = 'installed' if changed else 'up to date'
+        elapsed = time.monotonic() - start
+        report(key, f"{status.capitalize()} in {elapsed:.1f}s")
+        results[key] = (status, elapsed)
+        return status
+
+    # every package gets a thread, so waiting on dependencies can't deadlock;
+    # the semaphores limit how much work actually happens at once
+    with ThreadPoolExecutor(max(len(order), 1)) as executor:
+        for key in order:  # dependencies are submitted before dependents
+            futures[key] = executor.submit(work, key)
+
+    return {key: results[key] for key in order}
@@ -0,0 +1,252 @@
+"""Read and write the old-style (NeXTSTEP) property lists 'defaults read' prints.
+
+For example:
+
+    {
+        autohide = 1;
+        "autohide-delay" = "0.05";
+        "persistent-others" =     (
+        );
+        "NSStatusItem Visible Clock" = 1;
+    }
+
+Old-style plists only have strings, data, arrays and dictionaries, so
+unquoted integers and floats are returned as numbers and everything else
+as strings. Data is written by 'defaults' either as <62706c69 73743030>
+or, on newer systems, as {length = 8, bytes = 0x62706c6973743030}, which
+for long values elides the middle (see TruncatedData).
+"""
+import re
+
+__all__ = ['PlistError', 'TruncatedData', 'loads', 'dumps']
+
+
+class PlistError(ValueError):
+    pass
+
+
+class TruncatedData(bytes):
+    """Data that 'defaults read' only showed the start and end of.
+
+    The bytes are the shown start, 'length' the length of the full value,
+    and 'tail' the shown end.
+    """
+
+    def __new__(cls, head, length, tail=b''):
+        self = super().__new__(cls, head)
+        self.length = length
+        self.tail = tail
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, TruncatedData):
+            return False
+        return (bytes(self), self.length, self.tail) == (bytes(other), other.length, other.tail)
+
+    __hash__ = bytes.__hash__
+
+    def __repr__(self):
+        return f"TruncatedData({bytes(self)!r}, {self.length}, {self.tail!r})"
+
+
+_TOKEN = re.compile(r'''
+    (?P<skip> \s+ | //[^\n]* | /\*.*?\*/ )
+  | (?P<data> \{\s*length\s*=\s*(?P<length>\d+)\s*,\s*bytes\s*=\s*0x
+        (?P<head>[0-9a-fA-F\s]*?) (?:\.\.\.(?P<tail>[0-9a-fA-F\s]*))? \} )
+  | (?P<angle> <(?P<hex>[0-9a-fA-F\s]*)> )
+  | (?P<quoted> "(?P<string>(?:[^"\\]|\\.)*)" )
+  | (?P<punct> [{}();=,] )
+  | (?P<bare> (?:[^\s{}();=,"<>/]|/(?![/*]))+ )
+''', re.VERBOSE | re.DOTALL)
+
+_ESCAPE = re.compile(r'\\(U[0-9a-fA-F]{4}|[0-7]{1,3}|.)', re.DOTALL)
+_ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_INT = re.compile(r'-?\d+')
+_FLOAT = re.compile(r'-?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?|-?\d+[eE][-+]?\d+')
+
+
+def _unescape_one(m):
+    s = m[1]
+    if s[0] == 'U':
+        return chr(int(s[1:], 16))
+    if s[0] in '01234567':
+        return chr(int(s, 8))
+    return _ESCAPES.get(s, s)
+
+
+def _unescape(s):
+    if '\\' not in s:
+        return s
+
+    s = _ESCAPE.sub(_unescape_one, s)
+    # non-BMP characters are written as a pair of \U surrogates
+    return s.encode('utf-16', 'surrogatepass').decode('utf-16')
+
+
+def _hex(s):
+    return bytes.fromhex(''.join(s.split()))
+
+
+def _tokenize(text):
+    """Yield the (kind, value, offset) tokens of text, as they're parsed."""
+    pos, end = 0, len(text)
+    match = _TOKEN.match
+    while pos < end:
+        m = match(text, pos)
+        if not m:
+            raise PlistError(f"Unexpected {text[pos]!r} at offset {pos}")
+
+        kind = m.lastgroup
+        if kind == 'bare' or kind == 'punct':
+            yield kind, m[kind], pos
+        elif kind == 'quoted':
+            yield kind, _unescape(m['string']), pos
+        elif kind == 'angle':
+            yield 'data', _hex(m['hex']), pos
+        elif kind == 'data':
+            head, length = _hex(m['head']), int(m['length'])
+            if m['tail'] is None:
+                if len(head) != length:
+                    raise PlistError(f"Data at offset {pos} isn't {length} bytes long")
+                yield 'data', head, pos
+            else:
+                yield 'data', TruncatedData(head, length, _hex(m['tail'])), pos
+        pos = m.end()
+
+    yield 'end', None, end
+
+
+class _Parser:
+    """Parses tokens as they're read, with one token of lookahead."""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.token = next(self.tokens)
+
+    def next(self):
+        token = self.token
+        if token[0] != 'end':
+            self.token = next(self.tokens)
+        return token
+
+    def peek(self):
+        return self.token[1]
+
+    def expect(self, punct):
+        kind, value, offset = self.next()
+        if kind != 'punct' or value != punct:
+            raise PlistError(f"Expected {punct!r} at offset {offset}, got {_describe(value)}")
+
+    def value(self):
+        kind, value, offset = self.next()
+        if kind == 'bare':
+            if _INT.fullmatch(value):
+                return int(value)
+            if _FLOAT.fullmatch(value):
+                return float(value)
+            return value
+        if kind in ('quoted', 'data'):
+            return value
+        if value == '{':
+            return self.dict()
+        if value == '(':
+            return self.array()
+        raise PlistError(f"Expected a value at offset {offset}, got {_describe(value)}")
+
+    def dict(self):
+        result = {}
+        while True:
+            kind, key, offset = self.next()
+            if kind == 'punct' and key == '}':
+                return result
+            if kind not in ('bare', 'quoted'):
+                raise PlistError(f"Expected a key at offset {offset}, got {_describe(key)}")
+
+            self.expect('=')
+            result[key] = self.value()
+            self.expect(';')
+
+    def array(self):
+        result = []
+        while self.peek() != ')':
+            result.append(self.value())
+            if self.peek() != ')':
+                self.expect(',')
+        self.next()
+        return result
+
+
+def _describe(value):
+    return 'end of input' if value is None else repr(value)
+
+
+def loads(text):
+    """Parse an old-style plist into Python values."""
+    parser = _Parser(text)
+    value = parser.value()
+    kind, _, offset = parser.next()
+    if kind != 'end':
+        raise PlistError(f"Unexpected content at offset {offset}")
+    return value
+
+
+_BARE = re.compile(r'[A-Za-z0-9]+')
+
+
+def _quote(s):
+    if _BARE.fullmatch(s):
+        return s
+
+    out = []
+    for c in s:
+        if c in '"\\':
+            out.append('\\' + c)
+        elif c == '\n':
+            out.append('\\n')
+        elif c == '\t':
+            out.append('\\t')
+        elif ' ' <= c <= '~':
+            out.append(c)
+        else:
+            # \U escapes are UTF-16, so split non-BMP characters into surrogates
+            units = c.encode('utf-16-be')
+            out.extend(f'\\U{int.from_bytes(units[i:i + 2]):04x}' for i in range(0, len(units), 2))
+    return f'"{"".join(out)}"'
+
+
+def _words(data):
+    return ' '.join(data[i:i + 4].hex() for i in range(0, len(data), 4))
+
+
+def _format(value, level):
+    indent = '    ' * level
+    if isinstance(value, dict):
+        lines = [f'{indent}{{']
+        lines.extend(
+            f'{indent}    {_quote(str(k))} = {_format(v, level + 1)};' for k, v in value.items()
+        )
+        lines.append(f'{indent}}}')
+        return '\n'.join(lines)
+    if isinstance(value, (list, tuple)):
+        items = ',\n'.join(f'{indent}    {_format(v, level + 1)}' for v in value)
+        return f'{indent}(\n{items}\n{indent})' if items else f'{indent}(\n{indent})'
+    if isinstance(value, TruncatedData):
+        return f'{{length = {value.length}, bytes = 0x{_words(value)} ... {_words(value.tail)} }}'
+    if isinstance(value, (bytes, bytearray)):
+        return f'{{length = {len(value)}, bytes = 0x{value.hex()}}}'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return _quote(str(int(value)))
+    if isinstance(value, (int, float, str)):
+        return _quote(str(value))
+    raise TypeError(f"Can't write {type(value).__name__} to an old-style plist")
+
+
+def dumps(value):
+    """Format Python values like 'defaults read' does.
+
+    Booleans and numbers are written as 'defaults' shows them, so they read
+    back as integers or strings.
+    """
+    return _format(value, 0)
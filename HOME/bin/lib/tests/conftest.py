@@ -0,0 +1,174 @@
+import hashlib
+import http.server
+import json
+import os
+import plistlib
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+BIN_DIR = Path(__file__).resolve().parents[2]
+
+# A stand-in for macOS 'defaults' that keeps each domain in a plist file under
+# $FAKE_DEFAULTS_DIR and logs every invocation to calls.jsonl there.
+FAKE_DEFAULTS = f"""#!{sys.executable}
+import json
+import os
+import plistlib
+import sys
+from pathlib import Path
+
+sys.path.insert(0, {str(BIN_DIR)!r})
+from lib import plist
+
+TYPES = {{
+    bool: 'boolean', int: 'integer', float: 'float', str: 'string',
+    dict: 'dictionary', list: 'array', bytes: 'data',
+}}
+
+root = Path(os.environ['FAKE_DEFAULTS_DIR'])
+args = sys.argv[1:]
+with open(root / 'calls.jsonl', 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+
+host = 'any'
+if args[0] == '-currentHost':
+    host, args = 'current', args[1:]
+elif args[0] == '-host':
+    host, args = args[1], args[2:]
+
+cmd, domain, *rest = args
+path = root / host / (domain.replace('/', '%') + '.plist')
+values = plistlib.loads(path.read_bytes()) if path.exists() else {{}}
+
+
+def parse(args):
+    kind, *args = args
+    if not kind.startswith('-'):
+        return plistlib.loads(kind.encode())
+    if kind == '-dict':
+        pairs = iter(args)
+        return {{k: parse([t, v]) for k, t, v in zip(pairs, pairs, pairs)}}
+    if kind == '-array':
+        return list(args)
+    value, = args
+    return {{
+        '-string': str,
+        '-integer': int,
+        '-float': float,
+        '-boolean': lambda v: v in ('True', 'true', 'YES', '1'),
+        '-data': bytes.fromhex,
+    }}[kind](value)
+
+
+if cmd == 'export':
+    sys.stdout.buffer.write(plistlib.dumps(values))
+elif cmd in ('read', 'read-type'):
+    value = values[rest[0]] if rest else values
+    if cmd == 'read-type':
+        print(f"Type is {{TYPES[type(value)]}}")
+    elif isinstance(value, str):  # top-level strings are printed without quotes
+        print(value)
+    else:
+        print(plist.dumps(value).strip('"'))
+elif cmd in ('import', 'write'):
+    if cmd == 'import':
+        values = plistlib.loads(sys.stdin.buffer.read())
+    else:
+        key, *value = rest
+        values[key] = parse(value)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(plistlib.dumps(values))
+else:
+    sys.exit(f"fake defaults: unsupported command {{cmd!r}}")
+"""
+
+
+class FakeDefaults:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, domain, host):
+        return self.root / host / (domain.replace('/', '%') + '.plist')
+
+    def calls(self):
+        path = self.root / 'calls.jsonl'
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    def get(self, domain, host='any'):
+        return plistlib.loads(self._path(domain, host).read_bytes())
+
+    def set(self, domain, values, host='any'):
+        path = self._path(domain, host)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(plistlib.dumps(values))
+
+
+@pytest.fixture
+def fake_defaults(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'defaults'
+    script.write_text(FAKE_DEFAULTS)
+    script.chmod(0o755)
+
+    store = tmp_path / 'defaults'
+    store.mkdir()
+    monkeypatch.setenv('FAKE_DEFAULTS_DIR', str(store))
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+    return FakeDefaults(store)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    """Serves self.files with ETags, recording each request it gets."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}/{path}'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        path = self.path.lstrip('/')
+        server.requests.append((path, self.headers.get('If-None-Match')))
+        if path not in server.files:
+            self.send_error(404)
+            return
+
+        content = server.files[path]
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.stop()
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lib import aws
+
+BIN_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CREDENTIALS = """\
+[default]
+aws_access_key_id = KEY2
+[work]
+aws_access_key_id = KEY1
+[home]
+aws_access_key_id = KEY2
+"""
+
+
+@pytest.fixture
+def credentials(tmp_path, monkeypatch):
+    monkeypatch.delenv('AWS_PROFILE', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    path = tmp_path / 'credentials'
+    path.write_text(CREDENTIALS)
+    return path
+
+
+def test_parse_profile_name(credentials):
+    assert aws.parse_profile_name(credentials) == 'home'
+    credentials.write_text('[default]\naws_access_key_id = KEY3\n')
+    assert aws.parse_profile_name(credentials) == 'default'
+    credentials.write_text('[work]\naws_access_key_id = KEY1\n')
+    assert aws.parse_profile_name(credentials) is None
+    assert aws.parse_profile_name(credentials.parent / 'missing') is None
+
+
+def test_profile_name_cached(credentials, monkeypatch):
+    parsed = []
+    parse = aws.parse_profile_name
+    monkeypatch.setattr(aws, 'parse_profile_name', lambda path: parsed.append(path) or parse(path))
+
+    assert aws.profile_name(credentials) == 'home'
+    assert aws.profile_name(credentials) == 'home'
+    assert len(parsed) == 1
+
+    credentials.write_text(CREDENTIALS.replace('KEY2', 'KEY1 ', 1))  # a byte longer
+    assert aws.profile_name(credentials) == 'work'
+    assert len(parsed) == 2
+
+    credentials.write_text('[work]\n')
+    assert aws.profile_name(credentials) is None
+    assert aws.profile_name(credentials) is None  # None is cached too
+    assert len(parsed) == 3
+
+    monkeypatch.setenv('AWS_PROFILE', 'other')
+    assert aws.profile_name(credentials) == 'other'
+    assert aws.profile_name(credentials.parent / 'missing') == 'other'
+
+
+def test_cache_hit_imports_only_os(credentials):
+    code = (
+        "import sys; from lib.aws import profile_name; before = set(sys.modules); "
+        f"profile_name({str(credentials)!r}); print(sorted(set(sys.modules) - before))"
+    )
+    run = lambda: subprocess.run(
+        [sys.executable, '-S', '-c', code], cwd=BIN_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    assert 'configparser' in run()  # parsed
+    assert run() == '[]\n'
+
+    code = "import os, sys; before = set(sys.modules); import lib.aws; print(sorted(set(sys.modules) - before))"
+    result = subprocess.run([sys.executable, '-S', '-c', code], cwd=BIN_DIR, capture_output=True, text=True)
+    assert result.stdout == "['lib', 'lib.aws']\n"
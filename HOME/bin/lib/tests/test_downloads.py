@@ -0,0 +1,108 @@
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from lib import downloads
+from lib.downloads import DownloadCache
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_revalidates_cached_download(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    server.files['app.dmg'] = b'version 1'
+    url = server.url('app.dmg')
+
+    assert cache.fetch(url).read_bytes() == b'version 1'
+    assert cache.fetch(url).read_bytes() == b'version 1'
+    assert server.requests[1] == ('app.dmg', f'"{hashlib.md5(b"version 1").hexdigest()}"')
+
+    server.files['app.dmg'] = b'version 2'
+    assert cache.fetch(url).read_bytes() == b'version 2'
+    assert len(server.requests) == 3
+
+
+def test_known_hash_skips_network(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    server.files['one.zip'] = server.files['two.zip'] = b'same content'
+    cache.fetch(server.url('one.zip'))
+
+    blob = cache.fetch(server.url('two.zip'), sha256(b'same content'))
+    assert blob.read_bytes() == b'same content'
+    assert len(server.requests) == 1  # content-addressed, so found under another url
+
+    server.stop()
+    assert cache.fetch(server.url('two.zip'), sha256(b'same content')) == blob
+
+
+def test_hash_mismatch(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    server.files['app.zip'] = b'tampered'
+    with pytest.raises(ValueError, match='expected'):
+        cache.fetch(server.url('app.zip'), sha256(b'original'))
+    assert not list(cache.blobs.iterdir())
+    assert not cache._index()
+
+
+def test_evicts_least_recently_used(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache', max_size=25)
+    for name in ('a', 'b', 'c'):
+        server.files[name] = name.encode() * 10
+
+    a = cache.fetch(server.url('a'))
+    b = cache.fetch(server.url('b'))
+    os.utime(b, (0, 0))  # b is now older than a
+    cache.fetch(server.url('c'))
+
+    assert a.exists() and not b.exists()
+    assert set(cache._index()) == {server.url('a'), server.url('c')}
+
+
+def test_install_copies_from_cache(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    server.files['dir/Tool-1.0.tar.gz'] = b'archive'
+    url = server.url('dir/Tool-1.0.tar.gz')
+
+    first = cache.install(url, tmp_path / 'one')
+    second = cache.install(url, tmp_path / 'two')
+    assert first == tmp_path / 'one' / 'Tool-1.0.tar.gz'
+    assert first.read_bytes() == second.read_bytes() == b'archive'
+    first.write_bytes(b'changed')  # the cached file stays as it was
+    assert cache.fetch(url).read_bytes() == second.read_bytes() == b'archive'
+
+    server.stop()  # an unreachable server falls back to what's cached
+    assert cache.install(url, tmp_path / 'three').read_bytes() == b'archive'
+
+
+def test_index_locked_across_processes(server, tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    server.files['app.zip'] = b'content'
+    cache.root.mkdir(parents=True)
+    hold = 'import fcntl, sys; f = open(sys.argv[1], "a"); fcntl.flock(f, fcntl.LOCK_EX); print(flush=True); input()'
+    holder = subprocess.Popen(  # another process, holding the lock until told to stop
+        [sys.executable, '-c', hold, cache.root / 'index.lock'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    holder.stdout.readline()  # it has the lock
+    fetch = threading.Thread(target=cache.fetch, args=(server.url('app.zip'),))
+    fetch.start()
+    fetch.join(0.5)
+    assert fetch.is_alive() and not cache._index()  # downloaded, but waiting to record it
+
+    holder.communicate(b'\n')
+    fetch.join()
+    assert cache.digest(server.url('app.zip')) == sha256(b'content')
+
+
+def test_times_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, 'TIMEOUT', 0.2)
+    with socket.create_server(('127.0.0.1', 0)) as silent:  # accepts connections, never answers
+        url = f'http://127.0.0.1:{silent.getsockname()[1]}/app.zip'
+        with pytest.raises(TimeoutError):
+            DownloadCache(tmp_path / 'cache').fetch(url)
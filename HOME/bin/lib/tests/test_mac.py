@@ -1,5 +1,9 @@
+import base64
+import sys
 from unittest.mock import patch
 
+import pytest
+
 from lib import mac
 
 
@@ -35,3 +39,275 @@ def test_defaults_write_dict():
             '-dict', 'keyCode', '-integer', '47', 'modifierFlags', '-integer', '1310720'
         ]
     )
+
+
+def test_defaults_batch_one_export_per_domain(fake_defaults):
+    fake_defaults.set('com.apple.dock', {'orientation': 'left', 'autohide': False})
+
+    with mac.defaults.batch():
+        dock = mac.defaults['com.apple.dock']
+        dock['autohide'] = True
+        dock['autohide-delay'] = .05
+        dock['wvous-bl-corner'] = 10
+        for item in ('Clock', 'Battery', 'WiFi'):
+            mac.defaults['com.apple.controlcenter'][f"NSStatusItem Visible {item}"] = True
+        mac.defaults.g['KeyRepeat'] = 1
+        mac.defaults.currentHost['com.apple.screensaver']['idleTime'] = 420
+        assert fake_defaults.calls() == []  # nothing written until the block exits
+
+    calls = fake_defaults.calls()
+    assert sorted(c[-2] for c in calls if 'export' in c) == [
+        '-g', 'com.apple.controlcenter', 'com.apple.dock', 'com.apple.screensaver'
+    ]
+    assert [c for c in calls if 'write' in c][:3] == [  # only the changed keys, as write() would
+        ['write', 'com.apple.dock', 'autohide', '-boolean', 'True'],
+        ['write', 'com.apple.dock', 'autohide-delay', '-float', '0.05'],
+        ['write', 'com.apple.dock', 'wvous-bl-corner', '-integer', '10'],
+    ]
+    assert len(calls) == 4 + 8
+    assert fake_defaults.get('com.apple.dock') == {
+        'orientation': 'left', 'autohide': True, 'autohide-delay': .05, 'wvous-bl-corner': 10,
+    }
+    assert fake_defaults.get('com.apple.screensaver', host='current') == {'idleTime': 420}
+
+
+def test_defaults_batch_discarded_on_error(fake_defaults):
+    try:
+        with mac.defaults.batch():
+            mac.defaults['com.apple.dock']['autohide'] = True
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert fake_defaults.calls() == []
+    with mac.defaults.batch():  # the failed batch is no longer open
+        pass
+    assert mac.defaults['com.apple.dock']._batch is None
+
+
+def test_defaults_batch_writes_only_differences(fake_defaults):
+    fake_defaults.set('com.apple.dock', {'autohide': True, 'tilesize': 48})
+    fake_defaults.set('com.apple.finder', {'ShowPathbar': 1})
+
+    with mac.defaults.batch() as batch:
+        mac.defaults['com.apple.dock']['autohide'] = True
+        mac.defaults['com.apple.finder']['ShowPathbar'] = True  # 1 is an integer, not a boolean
+
+    assert [c[0] for c in fake_defaults.calls()] == ['export', 'export', 'write']
+    assert batch.changed == {'com.apple.finder'}
+    assert batch.plan == [(None, 'com.apple.finder', 'ShowPathbar', 1, True)]
+    assert fake_defaults.get('com.apple.dock') == {'autohide': True, 'tilesize': 48}
+
+
+def test_defaults_batch_dry_run(fake_defaults, capsys):
+    fake_defaults.set('com.apple.dock', {'autohide': False})
+
+    with mac.defaults.batch(dry_run=True) as batch:
+        mac.defaults['com.apple.dock']['autohide'] = True
+        mac.defaults['com.apple.dock']['mru-spaces'] = False
+
+    assert [c[0] for c in fake_defaults.calls()] == ['export']
+    assert batch.changed == {'com.apple.dock'}
+    assert fake_defaults.get('com.apple.dock') == {'autohide': False}
+    assert capsys.readouterr().out.splitlines() == [
+        "Would set com.apple.dock 'autohide': False -> True",
+        "Would set com.apple.dock 'mru-spaces': (unset) -> False",
+    ]
+
+
+def test_same_value():
+    assert mac.same_value({'a': [1, 'b']}, {'a': [1, 'b']})
+    assert not mac.same_value(1, True)
+    assert not mac.same_value(1, 1.0)
+    assert not mac.same_value({'a': [1]}, {'a': [True]})
+    assert not mac.same_value(mac.MISSING, False)
+
+
+def test_restart_os_functions_for_changed_domains():
+    with patch('subprocess.check_call') as check_call:
+        mac.restart_os_functions({'com.apple.menuextra.clock'})
+    assert check_call.call_args_list == [
+        ((['killall', 'SystemUIServer'],),), ((['killall', 'cfprefsd'],),)
+    ]
+
+    with patch('subprocess.check_call') as check_call:
+        mac.restart_os_functions(set())
+    check_call.assert_not_called()
+
+
+def test_defaults_cache_one_export_per_domain(fake_defaults):
+    fake_defaults.set('com.apple.controlcenter', {
+        f"NSStatusItem Visible {item}": True for item in ('Clock', 'Battery', 'WiFi')
+    })
+    fake_defaults.set('com.apple.dock', {'autohide': True, 'tilesize': 48, 'persistent-apps': []})
+
+    with mac.defaults.cache():
+        cc = mac.defaults['com.apple.controlcenter']
+        assert all(cc[f"NSStatusItem Visible {item}"].read() for item in ('Clock', 'Battery', 'WiFi'))
+        dock = mac.defaults['com.apple.dock']
+        assert dock['tilesize'].read() == 48
+        assert dock['autohide'].type() is bool
+        assert dock['persistent-apps'].read_json() == []
+        assert dock['tilesize'].read() == 48
+
+    assert fake_defaults.calls() == [
+        ['export', 'com.apple.controlcenter', '-'],
+        ['export', 'com.apple.dock', '-'],
+    ]
+
+
+def test_defaults_cache_follows_writes(fake_defaults):
+    fake_defaults.set('com.apple.dock', {'tilesize': 48})
+
+    with mac.defaults.cache():
+        dock = mac.defaults['com.apple.dock']
+        assert dock['tilesize'].read() == 48
+        dock['tilesize'] = 64  # drops the cached domain
+        assert dock['tilesize'].read() == 64
+
+        with mac.defaults.batch():  # compares with the cached domain, then drops it
+            dock['autohide'] = True
+        assert dock['autohide'].read() is True
+
+    assert [c[0] for c in fake_defaults.calls()] == ['export', 'write', 'export', 'write', 'export']
+
+
+def test_defaults_batch_keeps_others_writes(fake_defaults):
+    fake_defaults.set('-g', {'KeyRepeat': 2})
+
+    with mac.defaults.cache():
+        assert mac.defaults.g['KeyRepeat'].read() == 2  # exported
+        fake_defaults.set('-g', {'KeyRepeat': 2, 'AppleInterfaceStyle': 'Dark'})  # another app writes
+        with mac.defaults.batch():
+            mac.defaults.g['KeyRepeat'] = 1
+
+    assert fake_defaults.get('-g') == {'KeyRepeat': 1, 'AppleInterfaceStyle': 'Dark'}
+
+
+def test_defaults_batch_writes_as_write_does(fake_defaults):
+    fake_defaults.set('com.apple.dock', {})
+    for _ in range(2):
+        with mac.defaults.batch() as batch:
+            mac.defaults['com.apple.dock']['ids'] = [1, 2]  # stored as strings
+            mac.defaults['com.apple.dock']['apps'].write_plist([{'id': 1}])  # stored as is
+
+    assert fake_defaults.get('com.apple.dock') == {'ids': ['1', '2'], 'apps': [{'id': 1}]}
+    assert batch.changed == set()  # nothing to write the second time
+
+
+def test_defaults_read_typed(fake_defaults):
+    fake_defaults.set('com.apple.dock', {
+        'autohide': True,
+        'autohide-delay': .05,
+        'persistent-apps': [{'tile-data': {'file-label': 'Safari', 'file-type': 41, 'is-beta': False}}],
+        'recent': ['1', '2'],
+        'book': b'bplist00' * 100,
+    })
+    dock = mac.defaults['com.apple.dock']
+
+    assert dock['autohide'].read() is True
+    assert dock['autohide-delay'].read() == .05
+    assert dock['persistent-apps'].read() == [{'tile-data': {'file-label': 'Safari', 'file-type': 41, 'is-beta': False}}]
+    assert dock['recent'].read() == ['1', '2']
+    assert dock['book'].read() == b'bplist00' * 100
+    assert dock.read()['persistent-apps'][0]['tile-data']['is-beta'] is False
+    assert base64.b64decode(dock['book'].read_json()) == b'bplist00' * 100
+    assert dock.read_json()['autohide'] is True
+    assert {c[0] for c in fake_defaults.calls()} == {'export'}
+    with pytest.raises(KeyError):
+        dock['missing'].read()
+
+
+def test_defaults_read_same_with_and_without_cache(fake_defaults):
+    fake_defaults.set('com.apple.dock', {
+        'flag': True,
+        'ratio': 0.5,
+        'nested': {'on': False, 'scale': 1.5, 'names': ['1', '2'], 'items': [{'id': 3, 'blob': b'\0' * 64}]},
+        'book': b'bplist00' * 100,
+    })
+    dock = mac.defaults['com.apple.dock']
+    keys = ['flag', 'ratio', 'nested', 'book']
+
+    uncached = [dock[k].read() for k in keys], dock.read(), [dock[k].read_json() for k in keys]
+    with mac.defaults.cache():
+        cached = [dock[k].read() for k in keys], dock.read(), [dock[k].read_json() for k in keys]
+
+    assert cached == uncached
+    for a, b in zip(cached[0], uncached[0]):
+        assert mac.same_value(a, b)
+    assert uncached[0][:2] == [True, 0.5] and type(uncached[0][0]) is bool
+
+
+def test_defaults_write_data():
+    with patch('lib.mac.run') as run:
+        mac.defaults['com.apple.dock']['book'] = b'bplist00'
+
+    run.assert_called_once_with([
+        'defaults', 'write', 'com.apple.dock', 'book', '-data', '62706c6973743030'
+    ])
+
+
+# A stand-in for 'duti' that logs its settings file and applies it to the fake
+# LaunchServices domain.
+FAKE_DUTI = f"""#!{sys.executable}
+import os, plistlib, sys
+from pathlib import Path
+
+root = Path(os.environ['FAKE_DEFAULTS_DIR'])
+settings = Path(sys.argv[1]).read_text()
+with open(root / 'duti.log', 'a') as log:
+    log.write(settings + '--\\n')
+
+path = root / 'any' / {mac.LAUNCH_SERVICES.replace('/', '%') + '.plist'!r}
+values = plistlib.loads(path.read_bytes()) if path.exists() else {{}}
+handlers = values.setdefault('LSHandlers', [])
+for line in settings.splitlines():
+    bundleid, uti, role = line.split('\\t')
+    handlers[:] = [h for h in handlers if h.get('LSHandlerContentType') != uti]
+    handlers.append({{'LSHandlerContentType': uti, 'LSHandlerRoleAll': bundleid.lower()}})
+path.parent.mkdir(parents=True, exist_ok=True)
+path.write_bytes(plistlib.dumps(values))
+"""
+
+
+@pytest.fixture
+def fake_duti(fake_defaults, tmp_path):
+    script = tmp_path / 'bin' / 'duti'
+    script.write_text(FAKE_DUTI)
+    script.chmod(0o755)
+    log = fake_defaults.root / 'duti.log'
+    return lambda: log.read_text().split('--\n')[:-1] if log.exists() else []
+
+
+def test_sync_associations(fake_defaults, fake_duti):
+    fake_defaults.set(mac.LAUNCH_SERVICES, {'LSHandlers': [
+        {'LSHandlerContentType': 'public.json', 'LSHandlerRoleAll': 'com.microsoft.vscode'},
+        {'LSHandlerContentType': 'public.yaml', 'LSHandlerRoleAll': 'com.apple.textedit'},
+        {'LSHandlerURLScheme': 'https', 'LSHandlerRoleAll': 'com.google.chrome'},
+        {'LSHandlerContentType': 'public.html', 'LSHandlerRoleViewer': 'com.apple.safari'},
+    ]})
+    associations = [
+        ('public.json', 'com.microsoft.VSCode'),  # already set, in another case
+        ('public.yaml', 'com.microsoft.VSCode'),
+        ('public.html', 'com.microsoft.VSCode'),
+    ]
+
+    changes = mac.sync_associations(associations)
+    assert changes == [
+        ('public.yaml', 'com.apple.textedit', 'com.microsoft.VSCode'),
+        ('public.html', None, 'com.microsoft.VSCode'),
+    ]
+    assert fake_duti() == [
+        'com.microsoft.VSCode\tpublic.yaml\tall\ncom.microsoft.VSCode\tpublic.html\tall\n'
+    ]
+
+    assert mac.sync_associations(associations) == []  # nothing left to do
+    assert len(fake_duti()) == 1
+    assert [c[0] for c in fake_defaults.calls()] == ['export', 'export']
+
+
+def test_sync_associations_dry_run(fake_defaults, fake_duti, capsys):
+    changes = mac.sync_associations([('public.json', 'com.microsoft.VSCode')], dry_run=True)
+    assert changes == [('public.json', None, 'com.microsoft.VSCode')]
+    assert fake_duti() == []
+    assert capsys.readouterr().out == "Would open public.json with com.microsoft.VSCode (was (unset))\n"
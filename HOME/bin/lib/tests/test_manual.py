@@ -0,0 +1,206 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from lib import manual
+
+
+def git(*args, cwd):
+    identity = ['-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    subprocess.run(['git', *identity, *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_repo(path, files):
+    path.mkdir(parents=True)
+    git('init', '-q', '-b', 'main', cwd=path)
+    for name, content in files.items():
+        (path / name).write_text(content)
+    git('add', '-A', cwd=path)
+    git('commit', '-q', '-m', 'init', cwd=path)
+    return str(path)
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """A $HOME with packages and bin dirs, and a stand-in symgr on PATH."""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    tools = tmp_path / 'tools'
+    tools.mkdir()
+    symgr = tools / 'symgr'
+    symgr.write_text('#!/bin/sh\nln -s "$2" "$3/"\n')  # symgr -I source dest
+    symgr.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tools}:{os.environ['PATH']}")
+    (tmp_path / 'bin').mkdir()
+    return tmp_path
+
+
+def test_dependency_order():
+    packages = {'a': {}, 'b': {'depends': ['a']}, 'c': {'depends': ['b', 'a']}}
+    assert manual.dependency_order(packages, ['c', 'b', 'a']) == ['a', 'b', 'c']
+    assert manual.dependency_order(packages, ['c']) == ['c']  # the rest are installed
+
+    with pytest.raises(ValueError, match='unknown'):
+        manual.dependency_order({'a': {'depends': ['x']}}, ['a'])
+    with pytest.raises(ValueError, match='cycle'):
+        manual.dependency_order({'a': {'depends': ['b']}, 'b': {'depends': ['a']}}, ['a', 'b'])
+
+
+def test_install_packages_concurrently(home):
+    repos = home / 'repos'
+    packages = {
+        key: {
+            'git': make_repo(repos / key, {'tool': f'#!/bin/sh\necho {key}\n'}),
+            'cmd': 'sleep .5 && chmod +x tool',
+            'bin': 'tool' if key == 'one' else None,
+        }
+        for key in ('one', 'two', 'three', 'four')
+    }
+    packages = {k: {p: v for p, v in params.items() if v} for k, params in packages.items()}
+
+    start = time.monotonic()
+    results = manual.install_packages(packages, packages, home / '3rdparty', home / 'bin', jobs=4)
+    elapsed = time.monotonic() - start
+
+    assert {k: status for k, (status, _) in results.items()} == dict.fromkeys(packages, 'installed')
+    assert elapsed < 1.5  # four half-second builds at once, not one after another
+    assert subprocess.check_output([home / 'bin' / 'tool'], text=True) == 'one\n'
+
+
+def test_install_packages_failures_are_isolated(home, capsys):
+    repos = home / 'repos'
+    packages = {
+        'base': {'git': make_repo(repos / 'base', {'lib': 'base'}), 'cmd': 'exit 1'},
+        'dependent': {'git': make_repo(repos / 'dependent', {'x': ''}), 'depends': ['base']},
+        'other': {'git': make_repo(repos / 'other', {'lib': 'other'}), 'cmd': 'cp lib built'},
+        'missing': {'git': str(repos / 'nonexistent')},
+    }
+
+    results = manual.install_packages(packages, packages, home / '3rdparty', home / 'bin')
+
+    assert {k: status for k, (status, _) in results.items()} == {
+        'base': 'failed', 'dependent': 'skipped', 'other': 'installed', 'missing': 'failed',
+    }
+    assert (home / '3rdparty' / 'other' / 'built').read_text() == 'other'
+    assert not (home / '3rdparty' / 'dependent').exists()
+    assert "[dependent] Skipped: depends on base" in capsys.readouterr().out
+
+
+def test_install_waits_for_dependencies(home):
+    repos = home / 'repos'
+    packages = {
+        'first': {'git': make_repo(repos / 'first', {'x': ''}), 'cmd': 'sleep .3 && touch done'},
+        'second': {
+            'git': make_repo(repos / 'second', {'x': ''}),
+            'cmd': 'test -e ../first/done',
+            'depends': ['first'],
+        },
+    }
+    results = manual.install_packages(packages, ['second', 'first'], home / '3rdparty', home / 'bin')
+    assert [status for status, _ in results.values()] == ['installed', 'installed']
+
+
+def commit(repo, files):
+    for name, content in files.items():
+        (repo / name).write_text(content)
+    git('add', '-A', cwd=repo)
+    git('commit', '-q', '-m', 'update', cwd=repo)
+
+
+def test_incremental_update(home):
+    repo = home / 'repos' / 'pkg'
+    packages = {'pkg': {'git': make_repo(repo, {'src': 'v1'}), 'cmd': 'cp src built && echo >> ../builds'}}
+    packages_dir = home / '3rdparty'
+
+    def update():
+        results = manual.install_packages(packages, packages, packages_dir, home / 'bin', incremental=True)
+        return results['pkg'][0]
+
+    def builds():
+        return len((packages_dir / 'builds').read_text())
+
+    assert update() == 'installed'  # nothing recorded yet, so a clean install
+    assert update() == 'up to date'
+    assert builds() == 1
+
+    (packages_dir / 'pkg' / 'cache').write_text('')  # build artifacts survive updates
+    commit(repo, {'src': 'v2'})
+    assert update() == 'installed'
+    assert (packages_dir / 'pkg' / 'built').read_text() == 'v2'
+    assert (packages_dir / 'pkg' / 'cache').exists()
+    assert update() == 'up to date'
+    assert builds() == 2
+
+    packages['pkg']['cmd'] += ' && true'  # changed config: reinstall from scratch
+    assert update() == 'installed'
+    assert not (packages_dir / 'pkg' / 'cache').exists()
+
+    git('checkout', '-q', '--detach', 'HEAD~1', cwd=packages_dir / 'pkg')  # inconsistent checkout
+    assert update() == 'installed'
+    assert update() == 'up to date'
+    assert builds() == 4
+
+
+def test_incremental_update_tag(home):
+    repo = home / 'repos' / 'pkg'
+    make_repo(repo, {'src': 'v1'})
+    git('tag', '-a', '-m', 'v1', 'v1', cwd=repo)
+    commit(repo, {'src': 'v2'})
+    packages = {'pkg': {'git': str(repo), 'tag': 'v1', 'cmd': 'cp src built'}}
+    packages_dir = home / '3rdparty'
+
+    for expected in ('installed', 'up to date'):
+        results = manual.install_packages(packages, packages, packages_dir, home / 'bin', incremental=True)
+        assert results['pkg'][0] == expected
+    assert (packages_dir / 'pkg' / 'built').read_text() == 'v1'
+
+
+def test_install_url_from_cache(home, server):
+    server.files['tool.tar.gz'] = b'archive'
+    packages = {'tool': {'url': server.url('tool.tar.gz'), 'cmd': 'cp tool.tar.gz unpacked'}}
+
+    for _ in range(2):
+        results = manual.install_packages(packages, packages, home / '3rdparty', home / 'bin')
+        assert results['tool'][0] == 'installed'
+    assert (home / '3rdparty' / 'tool' / 'unpacked').read_bytes() == b'archive'
+    assert [etag is None for _, etag in server.requests] == [True, False]  # revalidated
+
+
+def test_install_dmg_named_by_download(home, server):
+    volume = home / 'Volumes' / 'My App'
+    hdiutil = home / 'tools' / 'hdiutil'
+    hdiutil.write_text(  # hdiutil attach -nobrowse file | hdiutil detach volume
+        f'#!/bin/sh\nif [ "$1" = attach ]; then test -f "$3" && mkdir -p "{volume}/My App.app"; '
+        f'else rm -r "$2"; fi\n'
+    )
+    hdiutil.chmod(0o755)
+    server.files['My%20App.dmg'] = b'dmg'
+    packages = {'app': {'url': server.url('My%20App.dmg'), 'dmg': str(volume / 'My App.app')}}
+
+    results = manual.install_packages(packages, packages, home / '3rdparty', home / 'bin')
+    assert results['app'][0] == 'installed'
+    assert (home / 'bin' / 'My App.app').is_dir()
+    assert not volume.exists()  # detached
+
+
+def test_incremental_update_url(home, server):
+    server.files['tool.tar.gz'] = b'v1'
+    packages = {
+        'tool': {'url': server.url('tool.tar.gz'), 'cmd': 'cp tool.tar.gz unpacked && echo >> ../builds'},
+        'other': {'url': server.url('tool.tar.gz')},
+    }
+    packages_dir = home / '3rdparty'
+
+    def update():
+        return manual.install_packages(packages, ['tool'], packages_dir, home / 'bin', incremental=True)['tool'][0]
+
+    assert manual.installed(packages, packages_dir) == []
+    assert update() == 'installed'
+    assert manual.installed(packages, packages_dir) == ['tool']  # not 'other', which was never installed
+    assert update() == 'up to date'
+    server.files['tool.tar.gz'] = b'v2'
+    assert update() == 'installed'
+    assert (packages_dir / 'tool' / 'unpacked').read_bytes() == b'v2'
+    assert update() == 'up to date'
+    assert len((packages_dir / 'builds').read_text()) == 2
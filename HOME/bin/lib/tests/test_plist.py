@@ -0,0 +1,111 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from lib import plist
+from lib.plist import PlistError, TruncatedData
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'defaults'
+
+
+def fixture(name):
+    return (FIXTURES / name).read_text().rstrip('\n')
+
+
+@pytest.mark.parametrize('name', [
+    'abnerworks.Typora.txt',
+    'com.apple.controlcenter.txt',
+    'com.apple.dock.txt',
+    'com.generalarcade.flycut.txt',
+])
+def test_round_trip_defaults_output(name):
+    text = fixture(name)
+    assert plist.dumps(plist.loads(text)) == text
+
+
+def test_parse_dock():
+    dock = plist.loads(fixture('com.apple.dock.txt'))
+    assert dock['autohide'] == 1
+    assert dock['autohide-delay'] == '0.05'  # 'defaults' quotes floats
+    assert dock['persistent-others'] == []
+    safari = dock['persistent-apps'][0]['tile-data']
+    assert safari['bundle-identifier'] == 'com.apple.Safari'
+    assert safari['file-data'] == {
+        '_CFURLString': 'file:///Applications/Safari.app/',
+        '_CFURLStringType': 15,
+    }
+    assert safari['book'] == TruncatedData(
+        bytes.fromhex('626f6f6b480200000000041030000000'), 584, bytes.fromhex('0400000000000000')
+    )
+
+
+def test_parse_escapes():
+    typora = plist.loads(fixture('abnerworks.Typora.txt'))
+    assert typora['NSUserKeyEquivalents'] == {'Open Link': '@$k', 'Toggle Sidebar': '@⌘s'}
+    assert typora['recentFolders'][2] == '/Users/kbd/Documents/café "menu"'
+
+    flycut = plist.loads(fixture('com.generalarcade.flycut.txt'))
+    assert flycut['store']['jcList'][1]['Contents'] == 'line one\nline two\ttabbed'
+    assert plist.loads(r'"\Ud83d\Ude00 \101"') == '\U0001f600 A'
+
+
+def test_parse_legacy_syntax():
+    assert plist.loads(fixture('legacy.txt')) == {
+        'bookmark': bytes.fromhex('62706c6973743030d40102030405060708'),
+        'empty': b'',
+        'names': ['one', 'two', 'three four'],
+        'nested': {'a': [], 'b': {}},
+        'path': '/usr/local/bin',
+        'ratio': 1.5,
+        'offset': -3,
+        'count': '7',
+    }
+
+
+@pytest.mark.parametrize('text', [
+    '{ a = 1 }', '{ a 1; }', '( a b )', '{ a = 1; } b', '"unterminated', '{ = 1; }',
+    '{length = 3, bytes = 0x6162}', '', '(',
+])
+def test_parse_errors(text):
+    with pytest.raises(PlistError):
+        plist.loads(text)
+
+
+def random_string(rng):
+    alphabet = 'abcXYZ019 _-./"\\\n\t;=(){}<>,é⌘😀'
+    s = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(8)))
+    return s + 'x' if s.isascii() and s.isdigit() else s  # digits read back as ints
+
+
+def random_value(rng, depth=0):
+    kinds = ['str', 'int', 'data'] + (['dict', 'list'] if depth < 4 else [])
+    kind = rng.choice(kinds)
+    if kind == 'str':
+        return random_string(rng)
+    if kind == 'int':
+        return rng.randrange(10**12)
+    if kind == 'data':
+        return rng.randbytes(rng.randrange(40))
+    if kind == 'dict':
+        return {random_string(rng): random_value(rng, depth + 1) for _ in range(rng.randrange(5))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+
+
+def test_fuzz_round_trip():
+    rng = random.Random(1234)
+    for _ in range(500):
+        value = {f'key {i}': random_value(rng) for i in range(rng.randrange(6))}
+        assert plist.loads(plist.dumps(value)) == value
+
+
+def test_fuzz_truncated_input():
+    rng = random.Random(5678)
+    texts = [fixture(p.name) for p in FIXTURES.iterdir()]
+    for _ in range(500):
+        text = rng.choice(texts)
+        cut = text[:rng.randrange(len(text))]
+        try:
+            plist.loads(cut)
+        except PlistError:
+            pass
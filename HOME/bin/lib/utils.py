@@ -1,7 +1,16 @@
+import glob
+import json
 import logging
+import marshal
+import os
 import re
+import shlex
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from unittest.mock import patch
 
 log = logging.getLogger(__name__)
@@ -9,9 +18,56 @@ log = logging.getLogger(__name__)
 
 
 EXECUTABLE = '/bin/bash'
+TRACE_VAR = 'SETUP_TRACE'  # path to record every command run to
 
+_trace_path = None
+_trace_lock = threading.Lock()
 
-def run(cmd, check=True, cap=False, input=None, exe='/bin/bash', cwd=None, env=None, **kwargs):
+
+@contextmanager
+def trace(path):
+    """Record every command run inside the block to 'path' as JSON lines.
+
+    Setting $SETUP_TRACE to a path does the same for a whole program, and
+    for any programs it starts. Summarize a trace with 'trace-summary'.
+    """
+    global _trace_path
+    previous, _trace_path = _trace_path, path
+    try:
+        yield
+    finally:
+        _trace_path = previous
+
+
+def _executable(cmd):
+    if not isinstance(cmd, str):
+        return os.path.basename(str(cmd[0]))
+    try:
+        words = shlex.split(cmd)
+    except ValueError:  # unbalanced quotes etc.
+        words = cmd.split()
+    return words[0] if words else ''
+
+
+def _record(path, cmd, args, start, elapsed, result, error):
+    record = dict(
+        start=start,
+        argv=cmd if isinstance(cmd, str) else [str(c) for c in cmd],
+        exe=_executable(cmd),
+        cwd=str(args['cwd'] or os.getcwd()),
+        shell=args['shell'],
+        seconds=round(elapsed, 6),
+        returncode=getattr(result, 'returncode', None),
+        stdout_bytes=len(result.stdout) if isinstance(getattr(result, 'stdout', None), bytes) else None,
+        stderr_bytes=len(result.stderr) if isinstance(getattr(result, 'stderr', None), bytes) else None,
+    )
+    if error:
+        record['error'] = error
+    with _trace_lock, open(path, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+
+def _run(cmd, check=True, cap=False, input=None, exe='/bin/bash', cwd=None, env=None, **kwargs):
     log.debug(f"Executing: {cmd!r}")
     shell = isinstance(cmd, str)
     args = dict(
@@ -26,10 +82,29 @@ def run(cmd, check=True, cap=False, input=None, exe='/bin/bash', cwd=None, env=N
     )
     args.update(kwargs)
 
-    result = subprocess.run(cmd, **args)
+    if not (path := _trace_path or os.environ.get(TRACE_VAR)):
+        return subprocess.run(cmd, **args)
+
+    start, timer = time.time(), time.perf_counter()
+    result = error = None
+    try:
+        result = subprocess.run(cmd, **args)
+        return result
+    except subprocess.CalledProcessError as e:
+        result = e
+        raise
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        _record(path, cmd, args, start, time.perf_counter() - timer, result, error)
+
+
+def run(cmd, check=True, cap=False, input=None, exe='/bin/bash', cwd=None, env=None, **kwargs):
+    result = _run(cmd, check, cap, input, exe, cwd, env, **kwargs)
 
     if cap:
-        return result.stdout.decode()
+        return (result.stderr if cap == 'stderr' else result.stdout).decode()
     else:
         return result
 
@@ -101,8 +176,317 @@ def test_run_shell_input():
     output = run(['cat'], cap=True, input='hello')
     expected_output = 'hello'
     assert output == expected_output
+
+
+def test_run_trace():
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'trace.jsonl')
+        with trace(path):
+            run(['echo', 'hi'], cap=True)
+            run('exit 2', check=False, cwd=d)
+            try:
+                run(['false'])
+            except subprocess.CalledProcessError:
+                pass
+        run(['true'])  # not traced
+
+        with open(path) as file:
+            records = [json.loads(line) for line in file]
+
+    assert [r['argv'] for r in records] == [['echo', 'hi'], 'exit 2', ['false']]
+    assert [r['exe'] for r in records] == ['echo', 'exit', 'false']
+    assert [r['shell'] for r in records] == [False, True, False]
+    assert [r['returncode'] for r in records] == [0, 2, 1]
+    assert [r['stdout_bytes'] for r in records] == [3, None, None]
+    assert records[1]['cwd'] == d
+    assert all(r['seconds'] >= 0 for r in records)
 # endregion run tests
 
+class ShellSession:
+    """One long-lived bash that runs string commands, so bash starts once.
+
+        with ShellSession() as sh:
+            sh.run('cd /tmp && ls', cap=True)
+
+    run takes the same arguments as the module's run and returns or raises
+    the same. Each command runs in a subshell of the session's bash, with
+    its own cwd and environment, and inherits this process's stdin, stdout
+    and stderr unless they're captured or given 'input'. List commands and
+    other arguments to subprocess.run go to the module's run.
+
+    Each command is sent to the shell's loop on one pipe as an id and shell
+    code, each NUL-terminated, and its exit status comes back on another as
+    '<id> <status>' lines. Captured output is written to files in a
+    temporary directory and read back once the status arrives.
+    """
+
+    def __init__(self, exe=EXECUTABLE):
+        import tempfile
+        self.exe = exe
+        self._lock = threading.Lock()
+        self._dir = tempfile.mkdtemp(prefix='shell-session.')
+        self._count = 0
+        self._environ = dict(os.environ)  # the session's, which commands' environments are set relative to
+
+        commands_read, commands_write = os.pipe()
+        status_read, status_write = os.pipe()
+        self._fds = commands_read, status_write
+        loop = (
+            f"while IFS= read -r -d '' id <&{commands_read} && IFS= read -r -d '' cmd <&{commands_read}; "
+            f"do eval \"$cmd\"; printf '%s %d\\n' \"$id\" $? >&{status_write}; done"
+        )
+        self._process = subprocess.Popen(
+            [exe, '--noprofile', '--norc', '-c', loop], env=self._environ, pass_fds=self._fds
+        )
+        os.close(commands_read)
+        os.close(status_write)
+        self._commands = os.fdopen(commands_write, 'wb')
+        self._status = os.fdopen(status_read, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        import shutil
+        if self._process.poll() is None:
+            self._commands.close()  # the loop reads EOF and the shell exits
+            self._process.wait()
+        self._status.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _script(self, cmd, cap, input, cwd, env):
+        """Return (id, files, shell code) to run 'cmd' in a subshell."""
+        files = {name: os.path.join(self._dir, name) for name in ('stdin', 'stdout', 'stderr')}
+        environment = env if env is not None else os.environ
+        # only what differs from the session's environment, usually nothing
+        setup = []
+        if unset := [k for k in self._environ if k not in environment and k.isidentifier()]:
+            setup.append(f"unset {' '.join(unset)}")
+        if exports := [
+            f'{k}={shlex.quote(v)}' for k, v in environment.items() if k.isidentifier() and self._environ.get(k) != v
+        ]:
+            setup.append(f"export {' '.join(exports)}")
+        if setup:  # readonly variables like SHELLOPTS can't be changed, which doesn't matter
+            setup = [f"{{ {'; '.join(setup)}; }} 2>/dev/null"]
+        setup.append(f'cd -- {shlex.quote(os.fspath(cwd if cwd is not None else os.getcwd()))} || exit')
+
+        redirects = [f'{fd}<&-' if fd == self._fds[0] else f'{fd}>&-' for fd in self._fds]
+        if input:
+            with open(files['stdin'], 'w') as file:
+                file.write(input)
+            redirects.append(f'<{shlex.quote(files["stdin"])}')
+        if cap in (True, 'stdout'):
+            redirects.append(f'>{shlex.quote(files["stdout"])}')
+        if cap in (True, 'stderr'):
+            redirects.append(f'2>{shlex.quote(files["stderr"])}')
+
+        self._count += 1
+        return self._count, files, f"({'; '.join(setup)}; eval {shlex.quote(cmd)}) {' '.join(redirects)}"
+
+    def _execute(self, cmd, cap, input, cwd, env):
+        if cwd is not None and not os.path.isdir(cwd):
+            raise FileNotFoundError(2, "No such directory", os.fspath(cwd))
+
+        with self._lock:
+            id, files, script = self._script(cmd, cap, input, cwd, env)
+            self._commands.write(f'{id}\0{script}\0'.encode())
+            self._commands.flush()
+            line = self._status.readline()
+            if not line:
+                raise RuntimeError(f"shell session ended (status {self._process.poll()})")
+            returned_id, returncode = map(int, line.split())
+            assert returned_id == id, f"expected the status of command {id}, got {returned_id}"
+
+            output = {}
+            for name in ('stdout', 'stderr'):
+                if cap in (True, name):
+                    with open(files[name], 'rb') as file:
+                        output[name] = file.read()
+        return subprocess.CompletedProcess(cmd, returncode, output.get('stdout'), output.get('stderr'))
+
+    def _run(self, cmd, check=True, cap=False, input=None, cwd=None, env=None):
+        log.debug(f"Executing in session: {cmd!r}")
+        if not (path := _trace_path or os.environ.get(TRACE_VAR)):
+            result = self._execute(cmd, cap, input, cwd, env)
+        else:
+            start, timer = time.time(), time.perf_counter()
+            result = error = None
+            try:
+                result = self._execute(cmd, cap, input, cwd, env)
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                _record(path, cmd, dict(cwd=cwd, shell=True), start, time.perf_counter() - timer, result, error)
+
+        if check and result.returncode:
+            raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+        return result
+
+    def run(self, cmd, check=True, cap=False, input=None, exe=None, cwd=None, env=None, **kwargs):
+        if not isinstance(cmd, str) or kwargs or (exe and exe != self.exe):
+            return run(cmd, check, cap, input, exe or EXECUTABLE, cwd, env, **kwargs)
+
+        result = self._run(cmd, check, cap, input, cwd, env)
+        if cap:
+            return (result.stderr if cap == 'stderr' else result.stdout).decode()
+        else:
+            return result
+
+
+# region ShellSession tests
+def test_shell_session_like_run():
+    import tempfile
+    with ShellSession() as sh, tempfile.TemporaryDirectory() as d:
+        for args, kwargs in [
+            (['echo hi; echo err >&2'], dict(cap=True)),
+            (['echo hi; echo err >&2; exit 3'], dict(check=False, cap='stderr')),
+            (['cat; pwd'], dict(cap='stdout', input='in\n', cwd=d)),
+            (['echo "$A|$HOME|"'], dict(cap=True, env={'A': "it's"})),
+            (['cd / && exit 4'], dict(check=False)),
+            (['if then'], dict(check=False, cap=True)),
+        ]:
+            expected, got = run(*args, **kwargs), sh.run(*args, **kwargs)
+            if isinstance(expected, subprocess.CompletedProcess):
+                expected, got = (expected.returncode, expected.stdout, expected.stderr), (got.returncode, got.stdout, got.stderr)
+            assert got == expected, args
+
+        assert sh.run('pwd', cap=True) == f'{os.getcwd()}\n'  # cd doesn't last
+        try:
+            sh.run('echo out; exit 5', cap=True)
+        except subprocess.CalledProcessError as e:
+            assert (e.returncode, e.stdout, e.stderr) == (5, b'out\n', b'')
+        else:
+            assert False, "expected CalledProcessError"
+
+
+def test_shell_session_one_shell():
+    with ShellSession() as sh:
+        pids = {sh.run('echo $$', cap=True) for _ in range(3)}  # the session's pid, in subshells too
+        assert pids == {f'{sh._process.pid}\n'}
+        assert sh.run(['echo', 'list'], cap=True) == 'list\n'
+    assert sh._process.returncode == 0
+# endregion ShellSession tests
+
+def run_iter(cmd, check=True, input=None, exe=EXECUTABLE, cwd=None, env=None, lines=True, errors='strict', **kwargs):
+    """Run cmd like run, yielding its stdout as it comes instead of capturing it.
+
+    Yield decoded lines, or with 'lines=False', chunks of bytes as they're
+    read. The child blocks once the pipe is full until they're consumed,
+    so output of any size streams through in constant memory. 'input' is a
+    str or bytes, or an iterable of them, written by a thread so neither
+    side waits on the other. Other arguments go to subprocess.Popen, eg.
+    stderr=subprocess.STDOUT.
+
+    Once the output ends, raise CalledProcessError if 'check' and the
+    command failed, without its output, which has been yielded. Closing
+    the generator early kills the command. It starts on the first
+    iteration, like any generator.
+    """
+    import io
+    shell = isinstance(cmd, str)
+    args = dict(
+        shell=shell,
+        stdout=subprocess.PIPE,
+        executable=exe if shell else None,
+        cwd=cwd,
+        env=env,
+    )
+    if input is not None:
+        args['stdin'] = subprocess.PIPE
+    args.update(kwargs)
+
+    path = _trace_path or os.environ.get(TRACE_VAR)
+    start, timer = time.time(), time.perf_counter()
+    log.debug(f"Streaming: {cmd!r}")
+    process = subprocess.Popen(cmd, **args)
+    writer, write_errors = None, []
+    if input is not None:
+        def write(chunks):
+            try:
+                for chunk in [chunks] if isinstance(chunks, (str, bytes)) else chunks:
+                    process.stdin.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            except BrokenPipeError:  # the command stopped reading
+                pass
+            except Exception as e:
+                write_errors.append(e)
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        writer = threading.Thread(target=write, args=(input,), daemon=True)
+        writer.start()
+
+    error = None
+    try:
+        if lines:
+            yield from io.TextIOWrapper(process.stdout, encoding='utf-8', errors=errors)
+        else:
+            while chunk := process.stdout.read1(1 << 16):
+                yield chunk
+    except BaseException as e:
+        error = repr(e)
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        process.wait()
+        if writer:
+            writer.join()
+        if path:
+            result = subprocess.CompletedProcess(cmd, process.returncode)
+            _record(path, cmd, args, start, time.perf_counter() - timer, result, error)
+
+    if write_errors:
+        raise write_errors[0]
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+# region run_iter tests
+def test_run_iter_streams():
+    start = time.perf_counter()
+    output = run_iter('echo one; sleep 1; echo two')
+    assert next(output) == 'one\n'
+    assert time.perf_counter() - start < 0.9  # before the command finished
+    assert list(output) == ['two\n']
+
+
+def test_run_iter_input_iterator():
+    # more than a pipe holds both ways, which would deadlock a naive writer
+    chunks = (f'{i:07}\n' for i in range(100_000))
+    total = sum(len(chunk) for chunk in run_iter(['cat'], input=chunks, lines=False))
+    assert total == 800_000
+    assert list(run_iter('tr a-z A-Z', input='ab\ncd')) == ['AB\n', 'CD']
+
+
+def test_run_iter_check():
+    output = run_iter('echo out; echo err >&2; exit 3', stderr=subprocess.STDOUT)
+    lines = []
+    try:
+        for line in output:
+            lines.append(line)
+    except subprocess.CalledProcessError as e:
+        assert e.returncode == 3
+    else:
+        assert False, "expected CalledProcessError"
+    assert lines == ['out\n', 'err\n']
+    assert list(run_iter('exit 3', check=False)) == []
+
+
+def test_run_iter_close_kills():
+    output = run_iter('echo one; exec sleep 30')
+    start = time.perf_counter()
+    assert next(output) == 'one\n'
+    output.close()
+    assert time.perf_counter() - start < 5
+# endregion run_iter tests
+
 def partition(pred, list):
     trues, falses = [], []
     for item in list:
@@ -182,6 +566,225 @@ def test_read_config_with_blanks_and_comments():
     assert actual == ['one', 'two', 'three', 'four', 'six']
 # endregion config file tests
 
+SETUP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+MANIFEST_SOURCES = ('conf/*.txt', 'conf/*.toml', 'conf/*.csv', 'HOME/bin/data/clips.txt')
+MANIFEST_VERSION = 1  # bump when parsing changes, to invalidate caches
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _manifest_cache_path():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache, 'setup', 'manifest.marshal')
+
+
+def _manifest_files(root):
+    return sorted({
+        os.path.relpath(path, root)
+        for pattern in MANIFEST_SOURCES for path in glob.glob(os.path.join(root, pattern))
+    })
+
+
+def _check_lines(path, lines, pattern, what):
+    for line in lines:
+        if not re.fullmatch(pattern, line):
+            raise ConfigError(f"{path}: {line!r} isn't {what}")
+    return lines
+
+
+def _parse_clips(path):
+    clips = {}
+    for line in read_config_file(path):
+        name, *value = line.split(maxsplit=1)
+        if not value:
+            raise ConfigError(f"{path}: clip {name!r} has no value")
+        if name in clips:
+            raise ConfigError(f"{path}: clip {name!r} is defined twice")
+        clips[name] = value[0]
+    return clips
+
+
+MANUAL_FIELDS = {
+    'git': str, 'tag': str, 'url': str, 'sha256': str, 'cmd': str, 'exe': str,
+    'bin': (str, list), 'dmg': str, 'depends': list,
+}
+
+
+def _parse_manual(path):
+    import tomllib
+    with open(path, 'rb') as file:
+        try:
+            packages = tomllib.load(file)
+        except tomllib.TOMLDecodeError as e:
+            raise ConfigError(f"{path}: {e}") from None
+
+    for key, params in packages.items():
+        if not isinstance(params, dict):
+            raise ConfigError(f"{path}: {key!r} isn't a table")
+        for field, value in params.items():
+            if field not in MANUAL_FIELDS:
+                raise ConfigError(f"{path}: [{key}] has unknown field {field!r}")
+            if not isinstance(value, MANUAL_FIELDS[field]):
+                raise ConfigError(f"{path}: [{key}] {field} should be {MANUAL_FIELDS[field]}")
+        if not params.keys() & {'git', 'url', 'cmd'}:
+            raise ConfigError(f"{path}: [{key}] needs a git, url or cmd")
+        if 'tag' in params and 'git' not in params:
+            raise ConfigError(f"{path}: [{key}] has a tag but no git")
+        if 'dmg' in params and 'url' not in params:
+            raise ConfigError(f"{path}: [{key}] has a dmg but no url")
+        for dep in params.get('depends', []):
+            if dep not in packages:
+                raise ConfigError(f"{path}: [{key}] depends on unknown package {dep!r}")
+    return packages
+
+
+def _parse_associations(path):
+    import csv
+    with open(path, newline='') as file:
+        rows = list(csv.reader(file))
+    if not rows or rows[0] != ['uti', 'bundleid', 'color']:
+        raise ConfigError(f"{path}: header should be uti,bundleid,color")
+    associations = []
+    for number, row in enumerate(rows[1:], 2):
+        if not row:
+            continue
+        if len(row) != 3 or not all('.' in field for field in row[:2]):
+            raise ConfigError(f"{path}:{number}: expected uti,bundleid,color, got {','.join(row)!r}")
+        associations.append(tuple(row))
+    return associations
+
+
+MANIFEST_PARSERS = {
+    'conf/manual.toml': _parse_manual,
+    'conf/associations.csv': _parse_associations,
+    'conf/vscode.txt': lambda path: _check_lines(
+        path, read_config_file(path), r'[\w-]+\.[\w.-]+', "a publisher.extension id"
+    ),
+    'conf/go.txt': lambda path: _check_lines(
+        path, read_config_file(path), r'\S+@\S+', "a package@version"
+    ),
+    'HOME/bin/data/clips.txt': _parse_clips,
+}
+
+
+def parse_conf(path, name=None):
+    """Parse and validate a config file by its path relative to the setup dir.
+
+    Lists of lines (like conf/npm.txt) are parsed with read_config_file.
+    Raise ConfigError if the file isn't valid.
+    """
+    parser = MANIFEST_PARSERS.get(name or os.path.relpath(path, SETUP_DIR), read_config_file)
+    return parser(path)
+
+
+def manifest(root=SETUP_DIR, cache_path=None):
+    """Return {relative path: parsed contents} for every config file in root.
+
+    The parsed files are cached with marshal, keyed on the files' paths,
+    sizes and modification times, so unchanged config is loaded without
+    parsing it (or importing tomllib or csv).
+    """
+    cache_path = cache_path or _manifest_cache_path()
+    files = _manifest_files(root)
+    key = [MANIFEST_VERSION, root]
+    for name in files:
+        stat = os.stat(os.path.join(root, name))
+        key.append((name, stat.st_mtime_ns, stat.st_size))
+
+    try:
+        with open(cache_path, 'rb') as file:
+            cached_key, cached = marshal.load(file)
+        if cached_key == key:
+            return cached
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    result = {name: parse_conf(os.path.join(root, name), name) for name in files}
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as file:
+        marshal.dump((key, result), file)
+    os.replace(temp, cache_path)
+    return result
+
+
+def read_conf(path):
+    """Return the parsed contents of a config file, from the manifest if it's in it."""
+    path = os.path.realpath(os.path.expanduser(path))
+    name = os.path.relpath(path, SETUP_DIR)
+    conf = manifest()
+    return conf[name] if name in conf else parse_conf(path)
+
+
+# region manifest tests
+def _write_setup_dir(root, files):
+    for name, content in files.items():
+        os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(content)
+
+
+def test_manifest():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+        _write_setup_dir(root, {
+            'conf/npm.txt': 'prettier\n# comment\ngit-open\n',
+            'conf/vscode.txt': 'charliermarsh.ruff\n',
+            'conf/manual.toml': '[a]\ngit = "x"\n[b]\ncmd = "y"\ndepends = ["a"]\n',
+            'conf/associations.csv': 'uti,bundleid,color\npublic.json,com.microsoft.vscode,\n',
+            'HOME/bin/data/clips.txt': 'shrug ¯\\_(ツ)_/¯\ncheck ✓\n',
+        })
+        cache = os.path.join(root, 'manifest.marshal')
+        expected = {
+            'HOME/bin/data/clips.txt': {'shrug': '¯\\_(ツ)_/¯', 'check': '✓'},
+            'conf/associations.csv': [('public.json', 'com.microsoft.vscode', '')],
+            'conf/manual.toml': {'a': {'git': 'x'}, 'b': {'cmd': 'y', 'depends': ['a']}},
+            'conf/npm.txt': ['prettier', 'git-open'],
+            'conf/vscode.txt': ['charliermarsh.ruff'],
+        }
+        assert manifest(root, cache) == expected
+
+        with patch(f'{__name__}.parse_conf') as parse:
+            assert manifest(root, cache) == expected  # from the cache
+            parse.assert_not_called()
+
+        _write_setup_dir(root, {'conf/npm.txt': 'prettier\n'})
+        os.utime(os.path.join(root, 'conf/npm.txt'), ns=(0, 0))
+        assert manifest(root, cache)['conf/npm.txt'] == ['prettier']
+
+
+def test_manifest_validation():
+    import tempfile
+
+    invalid = {
+        'conf/vscode.txt': 'charliermarsh ruff\n',
+        'conf/go.txt': 'github.com/x/y\n',
+        'conf/manual.toml': '[a]\ngti = "x"\n',
+        'conf/associations.csv': 'uti,bundleid\npublic.json,com.microsoft.vscode\n',
+        'HOME/bin/data/clips.txt': 'shrug\n',
+    }
+    for name, content in invalid.items():
+        with tempfile.TemporaryDirectory() as root:
+            _write_setup_dir(root, {name: content})
+            try:
+                manifest(root, os.path.join(root, 'manifest.marshal'))
+            except ConfigError as e:
+                assert name in str(e)
+            else:
+                assert False, f"expected {name} to be invalid"
+
+
+def test_setup_config_is_valid():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as cache:
+        conf = manifest(cache_path=os.path.join(cache, 'manifest.marshal'))
+    assert 'symgr' in conf['conf/manual.toml']
+# endregion manifest tests
+
 def run_commands(cmd, *args, **kwargs):
     """Take one or more commands to run as a subprocess.
 
@@ -194,6 +797,99 @@ def run_commands(cmd, *args, **kwargs):
     return run(cmd, *args, **kwargs)
 
 
+def _run_one(cmd, cap=False, **kwargs):
+    if isinstance(cmd, dict):  # a command with its own arguments
+        kwargs = {**kwargs, **cmd}
+        cmd = kwargs.pop('cmd')
+        cap = kwargs.pop('cap', cap)
+
+    result = _run(cmd, cap=cap, **kwargs)
+    if result.stdout is not None:
+        result.stdout = result.stdout.decode()
+    if result.stderr is not None:
+        result.stderr = result.stderr.decode()
+    return result
+
+
+def run_many(cmds, jobs=None, fail_fast=False, check=True, **kwargs):
+    """Run independent commands concurrently on up to 'jobs' threads.
+
+    Each command is passed to run along with 'kwargs'. A command can also be
+    a dict of its own arguments to run, with the command under 'cmd', eg.
+    {'cmd': 'make', 'cwd': path}.
+
+    Return a CompletedProcess per command, in the order given, with any
+    captured output decoded. If 'check', raise an ExceptionGroup of a
+    CalledProcessError for each command that failed once they've all
+    finished, or with 'fail_fast', raise the first failure as soon as it
+    happens: commands already running finish, but no more are started.
+    """
+    failed = []  # with fail_fast, the first failure stops the rest starting
+
+    def work(cmd):
+        if failed:
+            return None
+        result = _run_one(cmd, check=False, **kwargs)
+        if result.returncode and check and fail_fast:
+            failed.append(result)
+        return result
+
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as executor:
+        results = list(executor.map(work, cmds))
+
+    if failed:
+        raise _called_process_error(failed[0])
+    if check and (errors := [_called_process_error(r) for r in results if r.returncode]):
+        raise ExceptionGroup(f"{len(errors)} of {len(results)} commands failed", errors)
+
+    return results
+
+
+def _called_process_error(result):
+    return subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+
+
+# region run_many tests
+def test_run_many_order_and_output():
+    cmds = ['sleep .2; echo one', ['echo', 'two'], {'cmd': 'pwd', 'cwd': '/'}]
+    results = run_many(cmds, cap=True)
+    assert [r.stdout for r in results] == ['one\n', 'two\n', '/\n']
+    assert [r.returncode for r in results] == [0, 0, 0]
+
+
+def test_run_many_concurrent():
+    import time
+    start = time.monotonic()
+    run_many(['sleep .3'] * 4, jobs=4)
+    assert time.monotonic() - start < 1.2
+
+
+def test_run_many_collects_errors():
+    results = run_many(['exit 3', 'true', 'echo err >&2; exit 4'], check=False, cap='stderr')
+    assert [r.returncode for r in results] == [3, 0, 4]
+    assert results[2].stderr == 'err\n'
+
+    try:
+        run_many(['exit 3', 'true', 'exit 4'])
+    except ExceptionGroup as e:
+        assert sorted(err.returncode for err in e.exceptions) == [3, 4]
+    else:
+        assert False, "expected ExceptionGroup"
+
+
+def test_run_many_fail_fast():
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        try:
+            run_many(['exit 1', 'touch later'], jobs=1, fail_fast=True, cwd=d)
+        except subprocess.CalledProcessError as e:
+            assert e.returncode == 1
+        else:
+            assert False, "expected CalledProcessError"
+        assert not os.listdir(d)
+# endregion run_many tests
+
+
 def run_func_on_cmdline_input(func):
     for arg in sys.argv[1:]:
         print(func(arg))
@@ -1,11 +1,72 @@
-import datetime as dt
-import json
-import os
-import re
+"""Names to have at hand in interactive Python, imported when first used.
+
+Run as PYTHONSTARTUP, and by the ptpython and IPython configs. Modules are
+bound with importlib's LazyLoader, which imports them on first attribute
+access, and names from modules with a stand-in that imports on first use.
+So starting a REPL doesn't pay for importing polars unless 'pl' is used.
+"""
+import importlib
+import importlib.util
 import sys
-from pathlib import Path
-from pprint import pprint as pp
 
-import polars as pl
+
+def lazy_module(name):
+    """Return module 'name', to be imported on first attribute access.
+
+    Return None if it isn't installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class LazyName:
+    """Stands in for 'from module import attr' until first used.
+
+    Then it replaces itself with the real value in the namespace it's in.
+    """
+
+    def __init__(self, namespace, name, module, attr):
+        self._namespace = namespace
+        self._name = name
+        self._module = module
+        self._attr = attr
+
+    def _resolve(self):
+        value = getattr(importlib.import_module(self._module), self._attr)
+        if self._namespace.get(self._name) is self:
+            self._namespace[self._name] = value
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._resolve())
+
+    def __repr__(self):
+        return repr(self._resolve())
+
+
+dt = lazy_module('datetime')
+json = lazy_module('json')
+os = lazy_module('os')
+re = lazy_module('re')
+Path = LazyName(globals(), 'Path', 'pathlib', 'Path')
+pp = LazyName(globals(), 'pp', 'pprint', 'pprint')
+pl = lazy_module('polars')
 
 __all__ = ["dt", "json", "os", "re", "sys", "Path", "pp", "pl"]
+if pl is None:
+    del pl
+    __all__.remove("pl")
@@ -0,0 +1,114 @@
+"""Compare f's throughput with its text-only path and the original loop,
+and its serial and parallel paths on a file.
+
+usage: python HOME/bin/tests/bench_f.py [megabytes]
+"""
+import importlib.util
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from importlib.machinery import SourceFileLoader
+from multiprocessing import get_context
+from pathlib import Path
+
+F = Path(__file__).parent.parent / 'f'
+
+
+def load_f():
+    spec = importlib.util.spec_from_loader('f', SourceFileLoader('f', str(F)))
+    f = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(f)
+    # workers can't import f by name, so fork them with it already loaded
+    sys.modules['f'] = f
+    f.ProcessPoolExecutor = partial(ProcessPoolExecutor, mp_context=get_context('fork'))
+    return f
+
+
+def log_lines(megabytes):
+    """Generate something like a web server log."""
+    rng = random.Random(0)
+    paths = ['/', '/index.html', '/api/v1/items', '/static/app.js', '/login']
+    lines, size = [], 0
+    while size < megabytes * 2**20:
+        line = (
+            f'10.0.{rng.randrange(256)}.{rng.randrange(256)} - - [18/Oct/2026:10:{rng.randrange(60):02}:00]'
+            f' "GET {rng.choice(paths)} HTTP/1.1" {rng.choice((200, 304, 404))} {rng.randrange(10**6)}\n'
+        )
+        lines.append(line)
+        size += len(line)
+    return ''.join(lines).encode()
+
+
+def original(stdin, stdout, delim, index, flags):
+    """f before it read binary blocks: decode, split and print each line."""
+    end = '\0' if 'z' in flags else '\n'
+    split = re.compile(delim).split if 'r' in flags else partial(str.split, sep=delim)
+    for line in map(split, (line.rstrip() for line in stdin)):
+        for s in index:
+            for part in line[s]:
+                print(part, end=end, file=stdout)
+
+
+def measure(fn, data, *args):
+    # newline='\n' like sys.stdin, so only \n ends a line, as it does for f
+    stdin = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', newline='\n')
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+    start = time.perf_counter()
+    fn(stdin, stdout, *args)
+    stdout.flush()
+    return len(data) / 2**20 / (time.perf_counter() - start), stdout.buffer.getvalue()
+
+
+def main(megabytes):
+    f = load_f()
+    data = log_lines(megabytes)
+    cases = [(None, '0', ''), (None, '0,6,-1', ''), ('"', '1', ''), (r'\s+', '-2:', 'r')]
+    engines = [
+        ('original', original),
+        ('text', partial(f.fields, binary=False)),
+        ('bytes', f.fields),
+    ]
+    print(f"{len(data) / 2**20:.0f} MB of input, MB/s:")
+    print(f"{'case':<20}" + ''.join(f'{name:>10}' for name, _ in engines))
+    for delim, index, flags in cases:
+        rates, outputs = zip(*(
+            measure(engine, data, delim, f.parse_index(index), flags) for _, engine in engines
+        ))
+        assert len(set(outputs)) == 1, f"engines disagree on {delim!r} {index} {flags}"
+        case = ' '.join(repr(a) for a in (delim, index, flags) if a)
+        print(f"{case:<20}" + ''.join(f'{rate:>10.1f}' for rate in rates))
+
+    parallel(f, data)
+
+
+def parallel(f, data):
+    with tempfile.NamedTemporaryFile() as file:
+        file.write(data)
+        file.flush()
+
+        def measure_file(fn, *args):
+            with open(file.name) as stdin:
+                stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+                start = time.perf_counter()
+                fn(stdin, stdout, None, f.parse_index('0,-1'), '', *args)
+                stdout.flush()
+                return len(data) / 2**20 / (time.perf_counter() - start), stdout.buffer.getvalue()
+
+        cpus = os.cpu_count() or 1
+        print(f"\nserial vs parallel on a file ({cpus} cores), MB/s:")
+        serial, expected = measure_file(f.fields)
+        print(f"{'serial':<20}{serial:>10.1f}")
+        for jobs in sorted({1, 2, cpus // 2, cpus} - {0}):
+            rate, output = measure_file(f.fields_parallel, jobs)
+            assert output == expected, "parallel output differs"
+            print(f"{f'{jobs} processes':<20}{rate:>10.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,131 @@
+"""Benchmarks, compared with the baselines recorded in baselines.json.
+
+They take a while, so they only run with SETUP_BENCH=1 or when selected
+with '-m benchmark'. Times are divided by the time a fixed pure-Python loop
+takes on the same machine, so baselines recorded on one machine roughly
+hold on another. A benchmark fails if it has no baseline, or if it's more
+than SETUP_BENCH_TOLERANCE (a fraction, default 0.5) slower than it.
+SETUP_BENCH_UPDATE=1 records the results as the new baselines, and
+SETUP_BENCH_MB sets the size of the generated inputs for f and st.
+"""
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+BASELINES = Path(__file__).parent / 'baselines.json'
+TOLERANCE = float(os.environ.get('SETUP_BENCH_TOLERANCE', 0.5))
+UPDATE = bool(os.environ.get('SETUP_BENCH_UPDATE'))
+MEGABYTES = int(os.environ.get('SETUP_BENCH_MB', 256))
+
+_results = {}  # name -> (normalized time, baseline or None)
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('SETUP_BENCH') or UPDATE or 'benchmark' in (config.option.markexpr or ''):
+        return
+    skip = pytest.mark.skip(reason="benchmark: set SETUP_BENCH=1 or select with -m benchmark")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("benchmarks (times the calibration loop)")
+    for name, (score, baseline) in sorted(_results.items()):
+        change = f"{score / baseline - 1:+7.1%}" if baseline else "    new"
+        terminalreporter.write_line(f"{score:12.5f}  {change}  {name}")
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _calibration_loop():
+    total = 0
+    for i in range(1_000_000):
+        total += i * i % 7
+    return total
+
+
+@pytest.fixture(scope='session')
+def calibration():
+    """Seconds the calibration loop takes here, the unit benchmarks are measured in."""
+    return min(timed(_calibration_loop) for _ in range(5))
+
+
+@pytest.fixture(scope='session')
+def baselines():
+    recorded = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    yield recorded
+    if UPDATE:
+        BASELINES.write_text(json.dumps(recorded, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture
+def benchmark(request, calibration, baselines):
+    """Time a function and compare it with its baseline.
+
+    benchmark(func, repeat=5, per=1) takes the best of 'repeat' runs and
+    divides it by 'per' (eg. the calls or megabytes in a run). It's recorded
+    under the test's name.
+    """
+    def measure(func, repeat=5, per=1):
+        name = request.node.name
+        score = min(timed(func) for _ in range(repeat)) / per / calibration
+        baseline = baselines.get(name)
+        _results[name] = (score, baseline)
+        if UPDATE:
+            baselines[name] = round(score, 6)
+        elif baseline is None:
+            pytest.fail(f"no baseline for {name}: record one with SETUP_BENCH_UPDATE=1")
+        elif score > baseline * (1 + TOLERANCE):
+            pytest.fail(f"{name} took {score:.5g}, {score / baseline - 1:.0%} more than its baseline {baseline:.5g}")
+        return score
+    return measure
+
+
+# generated inputs
+
+
+def _write_lines(path, megabytes, line):
+    rng = random.Random(path.name)
+    size = 0
+    with open(path, 'w') as file:
+        while size < megabytes * 2**20:
+            lines = [line(rng) for _ in range(10_000)]
+            file.writelines(lines)
+            size += sum(map(len, lines))
+    return path
+
+
+@pytest.fixture(scope='session')
+def log_file(tmp_path_factory):
+    """MEGABYTES of something like a web server log."""
+    paths = ['/', '/index.html', '/api/v1/items', '/static/app.js', '/login']
+    return _write_lines(tmp_path_factory.mktemp('bench') / 'access.log', MEGABYTES, lambda rng: (
+        f'10.0.{rng.randrange(256)}.{rng.randrange(256)} - - [18/Oct/2026:10:{rng.randrange(60):02}:00]'
+        f' "GET {rng.choice(paths)} HTTP/1.1" {rng.choice((200, 304, 404))} {rng.randrange(10**6)}\n'
+    ))
+
+
+@pytest.fixture(scope='session')
+def word_files(tmp_path_factory):
+    """Two files of MEGABYTES / 2 of lines, some in both, and the same sorted."""
+    directory = tmp_path_factory.mktemp('bench')
+    files = [
+        _write_lines(directory / name, MEGABYTES // 2, lambda rng: f'word-{rng.randrange(10**7)}\n')
+        for name in ('a.txt', 'b.txt')
+    ]
+    for path in files[:]:
+        sorted_path = path.with_suffix('.sorted')
+        sorted_path.write_text(''.join(sorted(set(path.read_text().splitlines(keepends=True)))))
+        files.append(sorted_path)
+    return files
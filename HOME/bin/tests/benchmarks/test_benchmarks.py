@@ -0,0 +1,155 @@
+import ast
+import io
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from lib import mac
+from lib.utils import ShellSession, parse_config_file, run
+
+pytestmark = pytest.mark.benchmark
+
+BIN = Path(__file__).parent.parent.parent
+CALLS = 50  # of run, per measurement
+
+
+def test_run_exec(benchmark):
+    benchmark(lambda: [run(['true']) for _ in range(CALLS)], per=CALLS)
+
+
+def test_run_shell(benchmark):
+    benchmark(lambda: [run('true') for _ in range(CALLS)], per=CALLS)
+
+
+def test_shell_session(benchmark):
+    calls = 1000
+    with ShellSession() as shell:
+        benchmark(lambda: [shell.run('true') for _ in range(calls)], per=calls)
+
+
+def test_parse_config_file(benchmark):
+    lines = []
+    for i in range(200_000):
+        lines.append(f'# comment {i}\n' if i % 5 == 0 else '\n' if i % 7 == 0 else f'package-{i}  \n')
+    text = ''.join(lines)
+    benchmark(lambda: parse_config_file(io.StringIO(text)))
+
+
+def deep_dict(depth, width):
+    if depth == 0:
+        return {f'key{i}': [i, str(i), i / 2, True] for i in range(width)}
+    return {f'level{depth}.{i}': deep_dict(depth - 1, width) for i in range(width)}
+
+
+def test_flatten_deep_dict(benchmark):
+    value = deep_dict(5, 6)
+    benchmark(lambda: mac.flatten(value))
+
+
+def script(name, *args, stdin=None):
+    with open(stdin or os.devnull) as input:
+        subprocess.run(
+            [sys.executable, BIN / name, *map(str, args)], stdin=input, stdout=subprocess.DEVNULL, check=True
+        )
+
+
+def megabytes(*paths):
+    return sum(os.path.getsize(path) for path in paths) / 2**20
+
+
+@pytest.mark.parametrize('args', [(' ', '0,6,-1'), (r'"\s*', '1', 'r')], ids=['split', 'regex'])
+def test_f_throughput(benchmark, log_file, args):
+    benchmark(lambda: script('f', *args, stdin=log_file), repeat=2, per=megabytes(log_file))
+
+
+def test_st_throughput(benchmark, word_files):
+    a, b, _, _ = word_files
+    benchmark(lambda: script('st', a, '|', b), repeat=2, per=megabytes(a, b))
+
+
+def test_st_sorted_throughput(benchmark, word_files):
+    _, _, a, b = word_files
+    benchmark(lambda: script('st', a, '&', b, '--sorted'), repeat=2, per=megabytes(a, b))
+
+
+def has_main_guard(source):
+    """Return whether a module has a top-level "if __name__ == '__main__':"."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return False
+    return any(
+        isinstance(node, ast.If)
+        and isinstance(test := node.test, ast.Compare)
+        and isinstance(test.left, ast.Name) and test.left.id == '__name__'
+        and [type(op) for op in test.ops] == [ast.Eq]
+        and isinstance(test.comparators[0], ast.Constant) and test.comparators[0].value == '__main__'
+        for node in tree.body
+    )
+
+
+def startup_scripts():
+    """Python scripts in bin that only do their work under __main__."""
+    for path in sorted(BIN.iterdir()):
+        if path.is_file() and not path.suffix:
+            text = path.read_text(errors='replace')
+            shebang = text.partition('\n')[0]
+            if shebang.startswith('#!') and ('python' in shebang or 'uv run' in shebang) and has_main_guard(text):
+                yield path.name
+
+
+# scripts with third-party dependencies, skipped where those aren't installed;
+# any other script that doesn't load fails
+DEPENDENCIES = {
+    'dl': {'aush'},
+    'git-main-branch': {'aush'},
+    'install-manual': {'aush', 'tabulate'},
+    'randomtextgenerator': {'aush'},
+    'ts': {'dateutil'},
+}
+
+
+@pytest.mark.parametrize('name', list(startup_scripts()))
+def test_startup(benchmark, name):
+    # load the script, imports and all, without running its main
+    code = f"import runpy; runpy.run_path({str(BIN / name)!r}, run_name='startup')"
+    env = {**os.environ, 'PYTHONPATH': str(BIN)}
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+    if result.returncode:
+        missing = re.search(r"ModuleNotFoundError: No module named '([^'.]+)", result.stderr)
+        if missing and missing[1] in DEPENDENCIES.get(name, ()):
+            pytest.skip(f"{name} needs {missing[1]}")
+        pytest.fail(f"{name} doesn't load:\n{result.stderr}")
+    benchmark(lambda: subprocess.run([sys.executable, '-c', code], env=env, check=True), repeat=10)
+
+
+@pytest.fixture(scope='module')
+def aws_home(tmp_path_factory):
+    home = tmp_path_factory.mktemp('home')
+    (home / '.aws').mkdir()
+    (home / '.aws' / 'credentials').write_text(''.join(
+        f'[profile{i}]\naws_access_key_id = KEY{i}\naws_secret_access_key = secret\n' for i in range(50)
+    ) + '[default]\naws_access_key_id = KEY7\n')
+    return home
+
+
+@pytest.mark.parametrize('cached', [False, True], ids=['cold', 'cached'])
+def test_get_aws_profile(benchmark, aws_home, cached):
+    env = {k: v for k, v in os.environ.items() if k not in ('AWS_PROFILE', 'XDG_CACHE_HOME')}
+    # a cache of its own, which 'cold' empties before every lookup and 'cached' keeps warm
+    env.update(HOME=str(aws_home), XDG_CACHE_HOME=str(aws_home / f'cache-{cached}'))
+    cache = aws_home / f'cache-{cached}' / 'setup' / 'aws-profile'
+
+    def lookup():
+        if not cached:
+            cache.unlink(missing_ok=True)
+        output = subprocess.run([BIN / 'get-aws-profile'], env=env, capture_output=True, text=True).stdout
+        assert output == 'profile7\n'
+        assert cache.exists()
+
+    lookup()
+    benchmark(lookup, repeat=20)
@@ -0,0 +1,113 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).parent.parent / 'check-repos'
+loader = SourceFileLoader('check_repos', str(SCRIPT))
+check_repos = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+loader.exec_module(check_repos)
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'test', 'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'test', 'GIT_COMMITTER_EMAIL': 'test@example.com',
+}
+
+
+def git(repo, *args):
+    subprocess.run(['git', '-C', repo, *args], check=True, capture_output=True, env={**os.environ, **GIT_ENV})
+
+
+def make_repo(path, files=('a',)):
+    path.mkdir(parents=True)
+    git(path, 'init', '-q', '-b', 'main')
+    for name in files:
+        (path / name).write_text(name)
+    git(path, 'add', '.')
+    git(path, 'commit', '-q', '-m', 'first')
+    return path
+
+
+@pytest.fixture
+def projects(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    root = tmp_path / 'proj'
+    make_repo(root / 'clean')
+    dirty = make_repo(root / 'dirty', files=('a', 'b'))
+    (dirty / 'a').write_text('changed')
+    (dirty / 'b').write_text('staged')
+    git(dirty, 'add', 'b')
+    (dirty / 'new').write_text('')
+    make_repo(root / 'group' / 'nested')
+    make_repo(root / 'group' / 'deeper' / 'still' / 'repo')
+    (root / 'not-a-repo').mkdir()
+    return root
+
+
+def test_find_repos(projects):
+    found = [os.path.relpath(r, projects) for r in check_repos.find_repos(str(projects))]
+    assert found == ['clean', 'dirty', os.path.join('group', 'nested')]
+    assert len(list(check_repos.find_repos(str(projects), depth=5))) == 4
+
+
+def test_json(projects):
+    result = subprocess.run(
+        [sys.executable, SCRIPT, '--json', projects], capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': str(SCRIPT.parent)},
+    )
+    results = {os.path.basename(r.pop('path')): r for r in json.loads(result.stdout)}
+    assert list(results) == ['clean', 'dirty', 'nested']
+    assert results['clean'] == dict(branch='main', ahead=0, behind=0, staged=0, modified=0, untracked=0, conflicts=0)
+    assert results['dirty'] == dict(branch='main', ahead=0, behind=0, staged=1, modified=1, untracked=1, conflicts=0)
+
+
+def test_text(projects, capsys):
+    check_repos.main([str(projects / 'clean'), str(projects / 'dirty')])
+    assert capsys.readouterr().out.splitlines() == [
+        f"{projects / 'clean'}: main clean",
+        f"{projects / 'dirty'}: main +1 ~1 ?1",
+    ]
+
+
+def test_cache(projects, monkeypatch):
+    queried = []
+    git_status = check_repos.git_status
+    monkeypatch.setattr(check_repos, 'git_status', lambda repo: queried.append(repo) or git_status(repo))
+
+    check_repos.main(['--json', str(projects)])
+    assert len(queried) == 3
+    check_repos.main(['--json', '--cached', str(projects)])
+    assert len(queried) == 3  # nothing changed
+
+    git(projects / 'dirty', 'commit', '-q', '-m', 'second')
+    check_repos.main(['--json', '--cached', str(projects)])
+    assert queried[3:] == [str(projects / 'dirty')]
+
+    check_repos.main(['--json', str(projects)])  # without --cached, every repository
+    assert len(queried) == 7
+
+
+def test_edits_show_by_default(projects, capsys):
+    check_repos.main([str(projects / 'clean')])
+    (projects / 'clean' / 'a').write_text('edited')  # the index doesn't change
+    check_repos.main([str(projects / 'clean')])
+    check_repos.main(['--cached', str(projects / 'clean')])
+    assert [line.split(': ')[1] for line in capsys.readouterr().out.splitlines()] == [
+        'main clean', 'main ~1', 'main ~1',
+    ]
+
+
+def test_repo_status_tool(projects, tmp_path, monkeypatch, capsys):
+    tools = tmp_path / 'tools'
+    tools.mkdir()
+    (tools / 'repo_status').write_text('#!/bin/sh\necho "status of $(basename "$1")"\n')
+    (tools / 'repo_status').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tools}{os.pathsep}{os.environ['PATH']}")
+
+    check_repos.main([str(projects / 'dirty')])
+    assert capsys.readouterr().out == f"{projects / 'dirty'}: status of dirty\n"
@@ -0,0 +1,193 @@
+import importlib.util
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from importlib.machinery import SourceFileLoader
+from multiprocessing import get_context
+from pathlib import Path
+
+import pytest
+
+F = Path(__file__).parent.parent / 'f'
+f = importlib.util.module_from_spec(importlib.util.spec_from_loader('f', SourceFileLoader('f', str(F))))
+f.__spec__.loader.exec_module(f)
+sys.modules['f'] = f  # so worker processes can find its functions
+
+
+def reference(data, delim, index, flags):
+    """What f gave when it split decoded lines and printed each field."""
+    text = data.decode('utf-8', 'surrogateescape')
+    lines = [line.rstrip() for line in re.split('(?<=\n)', text) if line]
+    split = re.compile(delim).split if 'r' in flags else partial(str.split, sep=delim)
+    end = '\0' if 'z' in flags else '\n'
+    out = ''.join(f'{part}{end}' for line in map(split, lines) for s in index for part in line[s])
+    return out.encode('utf-8', 'surrogateescape')
+
+
+def run(data, delim, index, flags, binary=True):
+    stdin = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='surrogateescape')
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8', errors='surrogateescape')
+    f.fields(stdin, stdout, delim, f.parse_index(index), flags, binary=binary)
+    stdout.flush()
+    return stdout.buffer.getvalue()
+
+
+CASES = [
+    (None, '0', ''),
+    (None, '1,-1', ''),
+    (None, '-2:', 'z'),
+    (None, '::2,0', ''),
+    (',', '1', ''),
+    (',', '0:2,3', 'z'),
+    (', ', '-1', ''),
+    (r'\s*,\s*', '1:3', 'r'),
+    (r'(,)|(;)', ':', 'r'),
+    (r'\d+', '0,2', 'rz'),
+    ('é', '1', ''),
+]
+
+
+def random_data(rng, alphabet):
+    lines = [
+        ''.join(rng.choice(alphabet) for _ in range(rng.randrange(30)))
+        for _ in range(rng.randrange(1, 40))
+    ]
+    data = '\n'.join(lines).encode('utf-8', 'surrogateescape')
+    return data + b'\n' if rng.random() < .5 else data
+
+
+@pytest.mark.parametrize('delim,index,flags', CASES)
+def test_fields_match_reference(delim, index, flags, monkeypatch):
+    rng = random.Random(index + flags)
+    alphabets = [
+        'ab1 ,;\t',  # ASCII: the bytes path
+        'ab1 ,;\t\r\x0b\x1c\x1f',  # str.split() whitespace bytes.split() doesn't know
+        'ab1 ,;éé \xa0',  # non-ASCII text and whitespace
+        'ab ,\udcff',  # undecodable bytes
+    ]
+    for _ in range(200):
+        data = random_data(rng, rng.choice(alphabets))
+        expected = reference(data, delim, f.parse_index(index), flags)
+        assert run(data, delim, index, flags, binary=False) == expected
+        assert run(data, delim, index, flags) == expected
+        with monkeypatch.context() as m:  # lines spanning reads
+            m.setattr(f, 'BLOCK_SIZE', rng.randrange(1, 20))
+            assert run(data, delim, index, flags) == expected
+
+
+def test_f_command():
+    data = b'one two three\nfour five six\n'
+    result = subprocess.run([sys.executable, F, ',', '-1'], input=b'a,b\nc,d', capture_output=True)
+    assert result.stdout == b'b\nd\n'
+    result = subprocess.run([sys.executable, F, ' ', 'x'], input=data, capture_output=True)
+    assert result.returncode == 1
+    result = subprocess.run([sys.executable, F, '', '0,2'], input=data, capture_output=True)
+    assert result.stdout == b'one\nthree\nfour\nsix\n'
+
+
+def test_carriage_returns():
+    # only \n ends a line, as when f read sys.stdin, which doesn't translate newlines;
+    # \r is trailing whitespace, so \r\n works too
+    data = b'a,b\r\nc,d\re,f\r\r\ng,h\r'
+    expected = b'b\nd\re\nh\n'
+    assert run(data, ',', '1', '') == run(data, ',', '1', '', binary=False) == expected
+    assert subprocess.run([sys.executable, F, ',', '1'], input=data, capture_output=True).stdout == expected
+
+
+def random_index(rng):
+    def bound():
+        return rng.choice([None, rng.randrange(-12, 12)])
+
+    slices = []
+    for _ in range(rng.randrange(1, 4)):
+        if rng.random() < .3:
+            slices.append(str(rng.randrange(-12, 12)))
+        else:
+            step = rng.choice([None, None, 1, 2, 3, -1, -2])
+            parts = [bound(), bound()] + ([step] if step else [])
+            slices.append(':'.join('' if p is None else str(p) for p in parts))
+    return ','.join(slices)
+
+
+def test_select_lines_match_reference():
+    rng = random.Random(42)
+    for _ in range(2000):
+        lines = [f'line {i}  ' for i in range(rng.randrange(25))]
+        index = f.parse_index(random_index(rng))
+        expected = [line.rstrip() + '\n' for s in index for line in lines[s]]
+        out = []
+        f.select_lines(iter(lines), index, out.append, '\n')
+        assert ''.join(out).splitlines(keepends=True) == expected, index
+
+
+def test_select_lines_streams():
+    read = []
+
+    def lines():
+        for i in range(10**9):
+            read.append(i)
+            yield f'{i}\n'
+
+    out = []
+    f.select_lines(lines(), f.parse_index('2:5,0,1:10:3'), out.append, '\n')
+    assert ''.join(out) == '2\n3\n4\n0\n1\n4\n7\n'
+    assert len(read) == 10  # stopped once every slice was satisfied
+
+    out = []
+    f.select_lines(map(str, range(10**5)), f.parse_index(':3'), out.append, '\n')
+    assert out == ['0\n', '1\n', '2\n']  # written as each line was selected
+
+
+def test_select_lines_bounded_memory():
+    lines = (f'{i:>100}' for i in range(4 * 10**4))  # 6 MB if kept
+    out = []
+    tracemalloc.start()
+    try:
+        f.select_lines(lines, f.parse_index('-3:,:-10:10000,5'), out.append, '\n')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert ''.join(out).split() == [str(i) for i in (39997, 39998, 39999, 0, 10000, 20000, 30000, 5)]
+    assert peak < 2**20
+
+
+@pytest.mark.parametrize('delim,index,flags', CASES[::3])
+def test_fields_parallel(delim, index, flags, tmp_path, monkeypatch):
+    rng = random.Random(7)
+    data = b''.join(random_data(rng, alphabet) + b'\n' for alphabet in ['ab1 ,;\t', 'ab ,;é\x1c'] * 20)
+    path = tmp_path / 'input'
+    path.write_bytes(b'skipped line\n' + data)
+    monkeypatch.setattr(f, 'CHUNK_SIZE', 100)
+    # workers can't import f by name, so fork them with it already loaded
+    monkeypatch.setattr(f, 'ProcessPoolExecutor', partial(ProcessPoolExecutor, mp_context=get_context('fork')))
+
+    with open(path, encoding='utf-8', errors='surrogateescape') as stdin:
+        os.lseek(stdin.fileno(), len(b'skipped line\n'), os.SEEK_SET)  # eg. read by a previous command
+        assert f.use_parallel(stdin, 'p')
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8', errors='surrogateescape')
+        f.fields_parallel(stdin, stdout, delim, f.parse_index(index), flags, jobs=2)
+    assert stdout.buffer.getvalue() == reference(data, delim, f.parse_index(index), flags)
+
+
+def test_use_parallel(tmp_path):
+    path = tmp_path / 'input'
+    path.write_bytes(b'a b\n' * 100)
+    with open(path) as stdin:
+        assert not f.use_parallel(stdin, '')  # only when asked for, however big the file
+        assert f.use_parallel(stdin, 'p')
+        assert f.file_path(stdin.fileno()) == str(path)
+
+    deleted = tmp_path / 'deleted'
+    deleted.write_bytes(b'a b\n')
+    with open(deleted) as stdin:
+        deleted.unlink()
+        assert not f.use_parallel(stdin, 'p')  # workers couldn't open it
+
+    result = subprocess.run(['sh', '-c', f'cat {path} | {sys.executable} {F} "" 1 p'], capture_output=True)
+    assert result.stdout == b'b\n' * 100  # pipes are read serially
@@ -0,0 +1,157 @@
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+import pytest
+
+loader = SourceFileLoader('fzr', str(Path(__file__).parent.parent / 'fzr'))
+fzr = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+loader.exec_module(fzr)
+
+
+@pytest.fixture
+def state(tmp_path):
+    # counts the times the command really runs
+    (tmp_path / 'command').write_text(f'echo run >> {tmp_path}/runs; grep -c {{q}}')
+    return tmp_path
+
+
+def runs(state):
+    path = state / 'runs'
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_spool_in_chunks(state):
+    data = b'line\n' * 1000
+    writes = []
+
+    class Fzf(io.BytesIO):
+        def write(self, chunk):
+            writes.append(len(chunk))
+            return super().write(chunk)
+
+        def close(self):
+            writes.append(self.getvalue())
+
+    fzr.spool(io.BytesIO(data), state, chunk_size=64, tee=Fzf())
+    assert (state / 'input').read_bytes() == data
+    assert (state / 'done').exists()
+    assert writes[0] == 64 and writes[-1] == data  # passed on as it's read, then closed
+
+
+def test_spool_stops(state):
+    stop, lock = threading.Event(), threading.Lock()
+    source = io.BytesIO(b'line\n' * 1000)
+    reads = iter(range(3))
+
+    class Stopping(io.BytesIO):
+        def read(self, size):
+            if next(reads, None) is None:
+                with lock:
+                    stop.set()
+                    for path in state.iterdir():  # as the state directory is removed
+                        path.unlink()
+            return source.read(size)
+
+    fzr.spool(Stopping(), state, 64, stop, lock)
+    assert [path.name for path in state.iterdir()] == []
+
+
+def test_preview_while_spooling(state):
+    (state / 'input').write_bytes(b'a\nb\na\n')  # spooled so far
+    assert fzr.preview(state, 'a', delay=0) == b'2\n'
+    assert fzr.preview(state, 'a', delay=0) == b'2\n'
+    assert runs(state) == 2  # not cached, as the input isn't complete
+
+    fzr.spool(io.BytesIO(b'a\nb\na\n' * 100), state)
+    assert fzr.preview(state, 'a', delay=0) == b'200\n'
+    assert fzr.preview(state, 'a', delay=0) == b'200\n'
+    assert runs(state) == 3
+
+
+def test_preview_cached(state):
+    fzr.spool(io.BytesIO(b'a\nb\na\n'), state)
+    assert fzr.preview(state, 'a', delay=0) == b'2\n'
+    assert fzr.preview(state, 'b', delay=0) == b'1\n'
+    assert fzr.preview(state, 'a', delay=0) == b'2\n'
+    assert fzr.preview(state, 'x y', delay=0) == b'0\n'  # the query is quoted
+    assert runs(state) == 3
+
+    (state / 'command').write_text(f'echo run >> {state}/runs; grep {{q}}')  # a new command
+    assert fzr.preview(state, 'a', delay=0) == b'a\na\n'
+    assert runs(state) == 4
+
+
+def test_preview_lru(state):
+    fzr.spool(io.BytesIO(b'aaaa\nbbbb\n'), state)
+    for query in ('a', 'b', 'a', 'c'):
+        fzr.preview(state, query, delay=0, max_size=4)  # room for two outputs
+    assert runs(state) == 3
+    fzr.preview(state, 'a', delay=0, max_size=4)  # kept, since it was used after 'b'
+    assert runs(state) == 3
+    fzr.preview(state, 'b', delay=0, max_size=4)
+    assert runs(state) == 4
+
+
+def test_preview_debounced(state):
+    fzr.spool(io.BytesIO(b'a\nab\nabc\n'), state)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda q=q: results.update({q: fzr.preview(state, q, delay=0.2)}))
+        for q in ('a', 'ab', 'abc')
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    # the first query after a pause runs at once, then only the last of the rest;
+    # the ones skipped show the last output
+    assert results == {'a': b'3\n', 'ab': b'3\n', 'abc': b'1\n'}
+    assert runs(state) == 2
+
+
+def test_compact_history(tmp_path):
+    history = tmp_path / 'history'
+    history.write_text('jq .a\njq .a\njq .b\njq .a\njq .a\n')
+    fzr.compact_history(history)
+    assert history.read_text() == 'jq .a\njq .b\njq .a\n'
+    fzr.compact_history(tmp_path / 'missing')
+
+
+def test_preview_imports_little():
+    # fzf starts a preview per keystroke, so only main imports what it alone needs
+    code = f"import runpy, sys; runpy.run_path({loader.path!r}, run_name='preview'); print(*sorted(sys.modules))"
+    modules = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+    assert not {'argparse', 'tempfile'} & set(modules)
+
+
+def test_bindings_run_the_command(state):
+    # ctrl-c and ctrl-t copy what the command prints, not its errors
+    command = 'echo oops >&2; grep {q}'
+    fzf_cmd = fzr.get_fzf_cmd(command, state, state / 'history')
+    binding = next(arg for arg in fzf_cmd if arg.startswith('--bind=ctrl-c:'))
+    script = binding.removeprefix('--bind=ctrl-c:execute-silent(').removesuffix(' | cb)').replace('{q}', 'b')
+    fzr.spool(io.BytesIO(b'a\nb\n'), state)
+    result = subprocess.run(['sh', '-c', script], capture_output=True, text=True, check=True)
+    assert (result.stdout, result.stderr) == ('b\n', 'oops\n')
+
+
+def test_main_feeds_input_to_fzf(tmp_path, monkeypatch, capsys):
+    tools = tmp_path / 'tools'
+    tools.mkdir()
+    (tools / 'fzf').write_text(f'#!/bin/sh\ncat > {tmp_path}/items\necho .a\n')  # picks the query '.a'
+    (tools / 'fzf').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tools}:{os.environ['PATH']}")
+    monkeypatch.setattr(fzr, 'HISTORY_DIR', tmp_path / 'history')
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(b'{"a": 1}\n')))
+
+    assert fzr.main(['jq']) == 0
+    assert (tmp_path / 'items').read_bytes() == b'{"a": 1}\n'
+    assert capsys.readouterr().out == "jq '.a'\n"
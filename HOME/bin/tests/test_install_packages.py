@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BIN = Path(__file__).parent.parent
+SCRIPT = BIN / 'install-packages'
+LATENCY = 0.5  # seconds each stand-in tool takes
+
+# stands in for uv, go, cargo etc.: prints what it was asked, waits, and fails for 'bad'
+FAKE_TOOL = f"""\
+#!{sys.executable}
+import os, sys, time
+print(os.path.basename(sys.argv[0]), *sys.argv[1:], flush=True)
+time.sleep({LATENCY})
+print('done', flush=True)
+sys.exit('bad' in sys.argv)
+"""
+TOOLS = ['uv', 'bun', 'go', 'rustup-init', 'rustup', 'cargo', 'install-vscode-extensions']
+
+
+@pytest.fixture
+def install(tmp_path):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for tool in TOOLS:
+        (bin_dir / tool).write_text(FAKE_TOOL)
+        (bin_dir / tool).chmod(0o755)
+    conf = tmp_path / 'conf'
+    conf.mkdir()
+
+    def run(files, *args):
+        for name, content in files.items():
+            (conf / name).write_text(content)
+        env = {
+            **os.environ,
+            'HOME': str(tmp_path),
+            'PATH': f'{bin_dir}{os.pathsep}{os.environ["PATH"]}',
+            'PYTHONPATH': str(BIN),
+        }
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, SCRIPT, '--conf', conf, *args], env=env, capture_output=True, text=True
+        )
+        return result, time.perf_counter() - start
+    return run
+
+
+CONF = {
+    'python-tools.txt': 'posting\n--python 3.13 harlequin\n',
+    'npm.txt': 'prettier\ngit-open\n',
+    'go.txt': 'a@latest\nb@latest\nc@latest\n',
+    'cargo.txt': '',
+    'vscode.txt': 'a.b\n',
+}
+
+
+def test_lanes_run_concurrently(install):
+    result, elapsed = install(CONF)
+    assert result.returncode == 0, result.stdout + result.stderr
+    # about as long as the longest lane, rust, with 3 commands one after another
+    assert elapsed < 5 * LATENCY
+
+    lines = result.stdout.splitlines()
+    assert '          go | go install b@latest' in lines
+    assert 'python-tools | uv tool install -U --python 3.13 harlequin' in lines
+    assert '          js | bun install -g prettier git-open' in lines
+    for lane in ('python', 'python-tools', 'js', 'go', 'rust', 'vscode'):
+        assert any(line.startswith(f'{lane:>12} | done') for line in lines), lane
+
+    table = lines[lines.index('') + 1:]
+    assert table[0].split() == ['lane', 'package', 'status', 'time']
+    rows = [line.split() for line in table[1:table.index('')]]
+    assert len(rows) == 12
+    assert all(row[-2] == 'ok' for row in rows)
+    assert table[-1].startswith('total')
+
+
+def test_failure_skips_rest_of_lane(install):
+    result, _ = install({**CONF, 'go.txt': 'bad\nok\n', 'cargo.txt': 'ripgrep\n'}, 'go', 'rust')
+    assert result.returncode == 1
+    lines = result.stdout.splitlines()
+    rows = [line.split() for line in lines[lines.index('') + 2:]]
+    status = {row[1]: ' '.join(row[2:-1]) for row in rows if len(row) > 3}
+    assert status['bad'] == 'failed (1)'
+    assert status['ok'] == 'ok'  # the rest of the step still ran
+    assert status['ripgrep'] == 'ok'
+
+    result, _ = install({'cargo.txt': 'ripgrep\n'}, 'nope')
+    assert result.returncode == 2
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('aush')
+if sys.version_info < (3, 12):
+    pytest.skip("needs the Python the script runs with", allow_module_level=True)
+
+BIN = Path(__file__).parent.parent
+SCRIPT = BIN / 'install-vscode-extensions'
+LATENCY = 0.3  # seconds each 'code' call takes
+
+# a stand-in for 'code' that logs its arguments and takes a while, like the real one
+FAKE_CODE = f"""\
+#!{sys.executable}
+import os, sys, time
+with open(os.environ['CODE_LOG'], 'a') as log:
+    print(' '.join(sys.argv[1:]), file=log)
+if sys.argv[1:] == ['--list-extensions']:
+    print(os.environ['CODE_INSTALLED'].replace(' ', '\\n'))
+else:
+    time.sleep({LATENCY})
+    sys.exit('bad.ext' in sys.argv)
+"""
+
+
+@pytest.fixture
+def vscode(tmp_path):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'code').write_text(FAKE_CODE)
+    (bin_dir / 'code').chmod(0o755)
+    log = tmp_path / 'code.log'
+
+    def run(installed, expected, *args):
+        log.write_text('')
+        config = tmp_path / 'extensions.txt'
+        config.write_text(''.join(f'{ext}\n' for ext in expected))
+        env = {
+            **os.environ,
+            'PATH': f'{bin_dir}{os.pathsep}{os.environ["PATH"]}',
+            'PYTHONPATH': str(BIN),
+            'CODE_LOG': str(log),
+            'CODE_INSTALLED': ' '.join(installed),
+        }
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, SCRIPT, config, *map(str, args)], env=env, capture_output=True, text=True
+        )
+        return result.returncode, log.read_text().splitlines(), time.perf_counter() - start
+    return run
+
+
+def test_installs_in_concurrent_batches(vscode):
+    expected = [f'pub.ext{i:02}' for i in range(20)]
+    code, calls, elapsed = vscode(['pub.ext00', 'pub.other'], expected, '--batch-size', 5, '-j', 4)
+    assert code == 0
+    assert calls.count('--list-extensions') == 1
+    installs = [call.split() for call in calls if call != '--list-extensions']
+    assert len(installs) == 4  # 19 missing in batches of 5
+    assert sorted(arg for call in installs for arg in call[1::2]) == expected[1:]
+    assert {arg for call in installs for arg in call[::2]} == {'--install-extension'}
+    assert elapsed < 3 * LATENCY  # the batches ran at the same time
+
+
+def test_nothing_to_do(vscode):
+    code, calls, _ = vscode(['a.b', 'c.d'], ['a.b', 'c.d'])
+    assert (code, calls) == (0, ['--list-extensions'])
+
+
+def test_remove_unexpected(vscode):
+    code, calls, _ = vscode(['a.b', 'x.y', 'z.z'], ['a.b'])
+    assert (code, calls) == (0, ['--list-extensions'])  # only reported by default
+
+    code, calls, _ = vscode(['a.b', 'x.y', 'z.z'], ['a.b'], '--remove-unexpected')
+    assert (code, calls) == (0, ['--list-extensions', '--uninstall-extension x.y --uninstall-extension z.z'])
+
+
+def test_failed_batch(vscode):
+    code, calls, _ = vscode([], ['a.b', 'bad.ext', 'c.d'], '--batch-size', 1)
+    assert code == 1
+    assert len(calls) == 4  # the other batches still ran
@@ -0,0 +1,94 @@
+import cProfile
+import importlib.util
+import subprocess
+import sys
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).parent.parent / 'python-profile'
+loader = SourceFileLoader('python_profile', str(SCRIPT))
+python_profile = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+loader.exec_module(python_profile)
+
+PROGRAM = """\
+import sys
+
+def hot(n):
+    return sum(i * i for i in range(n))
+
+def alloc():
+    return [str(i) for i in range(50_000)]
+
+kept = alloc()
+print(hot(int(sys.argv[1])), sys.argv[2:])
+sys.exit(3)
+"""
+
+
+def profile(*args, cwd):
+    result = subprocess.run(
+        [sys.executable, SCRIPT, *map(str, args)], cwd=cwd, capture_output=True, text=True
+    )
+    return result.returncode, result.stdout, result.stderr
+
+
+def test_sample(tmp_path):
+    (tmp_path / 'prog.py').write_text(PROGRAM)
+    stacks = tmp_path / 'out.collapsed'
+    status, out, err = profile('--sample', '-o', stacks, 'prog.py', 300_000, '-o', 'x', cwd=tmp_path)
+    assert status == 3
+    assert out.endswith("['-o', 'x']\n")  # the program's own arguments
+    assert 'hot.<locals>.<genexpr> (prog.py:4)' in err
+
+    lines = stacks.read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.startswith('<module> (prog.py:1)') and int(count) > 0
+    assert any(line.startswith('<module> (prog.py:1);hot (prog.py:3);hot.<locals>.<genexpr>') for line in lines)
+
+
+def test_sample_module(tmp_path):
+    (tmp_path / 'prog.py').write_text(PROGRAM)
+    stacks = tmp_path / 'out.collapsed'
+    status, out, _ = profile('--sample', '-o', stacks, '-m', 'prog', 10, 'a', cwd=tmp_path)
+    assert (status, out) == (3, "285 ['a']\n")
+
+
+@pytest.mark.parametrize('target', [['prog.py'], ['-m', 'prog']], ids=['script', 'module'])
+@pytest.mark.parametrize('mode', [['--sample', '-o', 'out.collapsed'], ['--alloc']], ids=['sample', 'alloc'])
+def test_flag_arguments_pass_through(tmp_path, mode, target):
+    (tmp_path / 'prog.py').write_text(PROGRAM)
+    status, out, _ = profile(*mode, *target, 10, '--foo', 'bar', '-x', '-m', 'y', cwd=tmp_path)
+    assert (status, out) == (3, "285 ['--foo', 'bar', '-x', '-m', 'y']\n")
+
+
+def test_alloc(tmp_path):
+    (tmp_path / 'prog.py').write_text(PROGRAM)
+    status, _, err = profile('--alloc', '-n', 3, 'prog.py', 10, cwd=tmp_path)
+    assert status == 3
+    lines = err.splitlines()
+    assert lines[0].startswith('Peak traced memory')
+    assert lines[3].endswith('prog.py:7  return [str(i) for i in range(50_000)]')
+    assert len(lines) == 6
+
+
+def slow(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def test_diff(tmp_path):
+    for name, n in (('old', 1_000), ('new', 300_000)):
+        profiler = cProfile.Profile()
+        profiler.runcall(slow, n)
+        profiler.dump_stats(tmp_path / f'{name}.prof')
+
+    lines = python_profile.diff(tmp_path / 'old.prof', tmp_path / 'new.prof')
+    assert lines[0].startswith('Total time:')
+    assert lines[3].split()[0].startswith('+')
+    assert lines[3].endswith('(slow)')  # the function that regressed most comes first
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+STARTUP = Path(__file__).parent.parent / 'pythonstartup.py'
+BUDGET_US = 20_000  # import time the startup file may add to a REPL
+LAZY = ['datetime', 'json', 'pathlib', 'pprint', 'polars']
+
+
+def repl(code='', startup=True, args=()):
+    env = {k: v for k, v in os.environ.items() if k != 'PYTHONSTARTUP'}
+    if startup:
+        env['PYTHONSTARTUP'] = str(STARTUP)
+    return subprocess.run(
+        [sys.executable, *args, '-i', '-q'], input=code, env=env, capture_output=True, text=True
+    )
+
+
+def import_times(stderr):
+    """Return {module: self microseconds} from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'self [us]' not in line:
+            self_us, _, name = line.removeprefix('import time:').split('|')
+            times[name.strip()] = int(self_us)
+    return times
+
+
+def test_names_work():
+    result = repl(
+        "print(pp.__name__, Path('/a/b').name, isinstance(Path('.'), Path), json.dumps([dt.date(2026, 1, 1).year]))\n"
+        "print(type(Path).__name__, 'pl' in dir())\n"
+    )
+    lines = result.stdout.replace('>>> ', '').splitlines()
+    assert lines[0] == 'pprint b True [2026]'
+    has_polars = subprocess.run([sys.executable, '-c', 'import polars'], capture_output=True).returncode == 0
+    assert lines[1] == f'type {has_polars}'  # replaced by the real class once used
+
+
+def test_import_time_budget():
+    baseline = import_times(repl(startup=False, args=['-X', 'importtime']).stderr)
+    startup = import_times(repl(args=['-X', 'importtime']).stderr)
+    added = {name: us for name, us in startup.items() if name not in baseline}
+    assert not set(added) & set(LAZY), "imported eagerly"
+    assert sum(added.values()) < BUDGET_US, f"startup imports took too long: {added}"
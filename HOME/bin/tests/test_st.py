@@ -0,0 +1,97 @@
+import importlib.util
+import random
+import subprocess
+import sys
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+import pytest
+
+ST = Path(__file__).parent.parent / 'st'
+st = importlib.util.module_from_spec(importlib.util.spec_from_loader('st', SourceFileLoader('st', str(ST))))
+st.__spec__.loader.exec_module(st)
+
+
+def run(*args):
+    result = subprocess.run([sys.executable, ST, *map(str, args)], capture_output=True, text=True)
+    return result.returncode, result.stdout
+
+
+@pytest.fixture
+def files(tmp_path):
+    def write(*contents):
+        paths = []
+        for i, content in enumerate(contents):
+            paths.append(tmp_path / f'{i}.txt')
+            paths[-1].write_text(content)
+        return paths
+    return write
+
+
+def test_two_files(files):
+    a, b = files('c\na\nb\nb\n', 'b\nd\r\nc\x0bx')  # lines are split like str.splitlines()
+    assert run(a, '|', b) == (0, 'a\nb\nc\nd\nx\n')
+    assert run(a, 'intersection', b) == (0, 'b\nc\n')
+    assert run(a, '-', b) == (0, 'a\n')
+    assert run(a, '^', b) == (0, 'a\nd\nx\n')
+    assert run(a, 'nope', b)[0] == 1
+
+
+@pytest.mark.parametrize('op,expected', [
+    ('<=', [True, True, False]),
+    ('issubset', [True, True, False]),
+    ('<', [False, True, False]),
+    ('>=', [True, False, False]),
+    ('>', [False, False, False]),
+    ('==', [True, False, False]),
+    ('!=', [False, True, True]),
+    ('isdisjoint', [False, False, True]),
+])
+def test_comparisons(files, op, expected):
+    a, same, superset, other = files('a\nb\n', 'a\nb\nb\n', 'a\nb\nc\n', 'x\n')
+    results = [run(a, op, b)[0] == 0 for b in (same, superset, other)]
+    assert results == expected
+    if op in ('<=', '==', 'isdisjoint'):  # the same with other engines
+        assert [run(a, op, b, '--sorted')[0] == 0 for b in (same, superset, other)] == expected
+        assert [run(a, op, b, '--memory', 1)[0] == 0 for b in (same, superset, other)] == expected
+
+
+def test_n_ary(files):
+    paths = files('a\nb\nc\nd\n', 'b\nc\ne\n', 'c\nd\ne\nf\n')
+    assert run(paths[0], '|', *paths[1:])[1].split() == list('abcdef')
+    assert run(paths[0], '&', *paths[1:])[1].split() == ['c']
+    assert run(paths[0], '-', *paths[1:])[1].split() == ['a']
+    assert run(paths[0], '^', *paths[1:])[1].split() == ['a', 'c', 'f']
+    assert run(paths[0], '<=', *paths[1:])[0] == 1  # comparisons take two files
+
+
+def test_not_sorted(files):
+    a, b = files('b\na\n', 'a\n')
+    assert run(a, '|', b, '--sorted')[0] == 2
+
+
+def random_lines(rng, count):
+    return [rng.choice(['', 'x', 'é', ' ']) + str(rng.randrange(count)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('op', ['union', 'intersection', 'difference', 'symmetric_difference', 'venn'])
+def test_engines_agree(op, tmp_path, monkeypatch):
+    monkeypatch.setattr(st, 'MIN_PARTITIONS', 3)
+    rng = random.Random(op)
+    for _ in range(5):
+        contents = [random_lines(rng, rng.randrange(1, 300)) for _ in range(2 if op == 'venn' else 3)]
+        expected = st.combine(op, [set(c) for c in contents])
+        expected = expected if op == 'venn' else sorted(expected)
+
+        inputs = [lambda c=c: iter(c) for c in contents]
+        for budget in (10**9, 2000, 200):  # in memory, spilled, and spilled again
+            with st.ExitStack() as stack:
+                result = st.evaluate(op, inputs, budget, stack, sizes=[len(c) for c in contents])
+                assert (result if op == 'venn' else list(result)) == expected
+
+        paths = []
+        for i, c in enumerate(contents):
+            paths.append(tmp_path / f'{i}.txt')
+            paths[-1].write_text(''.join(line + '\n' for line in sorted(c)))
+        result = st.merge(op, paths)
+        assert (result if op == 'venn' else list(result)) == expected
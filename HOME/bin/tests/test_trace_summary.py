@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+TRACE_SUMMARY = Path(__file__).parent.parent / 'trace-summary'
+
+
+def test_trace_summary(tmp_path):
+    records = [
+        dict(argv=['defaults', 'write', 'com.apple.dock', 'autohide', '-boolean', 'True'],
+             exe='defaults', cwd='/', shell=False, seconds=.25, returncode=0),
+        dict(argv=['defaults', 'export', 'com.apple.dock', '-'],
+             exe='defaults', cwd='/', shell=False, seconds=.5, returncode=0),
+        dict(argv='git clone --depth 1 https://example.com/repo.git',
+             exe='git', cwd='/tmp', shell=True, seconds=2, returncode=128),
+    ]
+    trace = tmp_path / 'trace.jsonl'
+    trace.write_text(''.join(json.dumps(r) + '\n' for r in records))
+
+    output = subprocess.check_output(
+        [sys.executable, TRACE_SUMMARY, trace, '-n', '2'], text=True
+    ).splitlines()
+
+    assert output[0] == "3 processes spawned, 2.750s total"
+    assert output[3:5] == [
+        "     2.000s  [128]  git clone --depth 1 https://example.com/repo.git  (/tmp)",
+        "     0.500s  [0]  defaults export com.apple.dock -  (/)",
+    ]
+    assert output[-2:] == [
+        "     2.000s       1    2.000s  git",
+        "     0.750s       2    0.375s  defaults",
+    ]